@@ -0,0 +1,22 @@
+# gunicorn.conf.py
+# Servidor de producción en Linux:  gunicorn remote:app
+#
+# Un solo proceso: las sesiones (y sus Xvfb/Chrome) viven en memoria del
+# proceso, así que varios workers no verían las sesiones de los demás.
+# La concurrencia viene de los hilos: cada petición bloquea en X/xdotool o en
+# la compresión JPEG, que liberan el GIL.
+import os
+
+bind = "0.0.0.0:5000"
+workers = 1
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "16"))
+# Arrancar Chrome puede tardar varios segundos si el pool está vacío
+timeout = 60
+
+
+def post_worker_init(worker):
+    # Con gunicorn no se ejecuta el __main__ de remote.py: precalentar aquí
+    import remote
+    if remote.SO == "Linux":
+        remote.helpers.prewarm(remote.PREWARM_SESSIONS)
@@ -1,49 +1,695 @@
 # linux_helpers.py
 import os
+import re
 import time
+import select
 import signal
-import uuid
+import struct
+import secrets
+import atexit
+import itertools
+import queue
+import shutil
 import subprocess
+import threading
+import traceback
+import ctypes
+from ctypes import POINTER, byref, c_char, c_char_p, c_int, c_long, c_size_t, c_uint, c_ulong, c_void_p
 from threading import Lock
 from pathlib import Path
 from PIL import ImageGrab, Image
 import io
 
-lock = Lock()
+try:
+    import xcffib
+    import xcffib.shm
+    import xcffib.xproto
+except ImportError:
+    xcffib = None
+
+# libjpeg-turbo (PyTurboJPEG) codifica BGRX directamente desde la memoria
+# compartida, sin pasar por PIL; si no está, se usa el codificador de PIL.
+try:
+    import numpy
+    from turbojpeg import TurboJPEG, TJPF_BGRX, TJSAMP_420, TJFLAG_PROGRESSIVE
+    _tj = TurboJPEG()
+except Exception:
+    _tj = None
+
+# Solo serializa la elección de DISPLAY libre y el arranque de Xvfb; cada
+# sesión tiene su propio lock en session_info["_lock"]
+_display_alloc_lock = Lock()
+
+# Rutas absolutas: junto con close_fds=False permiten que subprocess use
+# posix_spawn (vfork+exec) en lugar de fork+exec al lanzar Xvfb y Chrome.
+# No se usa start_new_session porque desactiva ese camino rápido.
+XVFB_EXE = shutil.which("Xvfb") or "/usr/bin/Xvfb"
+CHROME_EXE = "/usr/bin/google-chrome"
+
+# Fallback sin libxdo: ruta resuelta una vez (exec sin recorrer $PATH) y
+# argumentos fijos como tuplas de módulo
+XDOTOOL_EXE = shutil.which("xdotool") or "xdotool"
+_XDOTOOL_SEARCH = (XDOTOOL_EXE, "search", "--onlyvisible", "--class", "chrome")
+_XDOTOOL_SEARCH_GEOMETRY = _XDOTOOL_SEARCH + ("getwindowgeometry", "--shell", "%1")
+
+# Sufijo de los perfiles temporales de Chrome (único dentro del proceso)
+_profile_counter = itertools.count()
+
+# Tiempo (s) durante el cual se reutilizan window_id y geometría sin volver a consultarlos
+GEOMETRY_TTL = 0.5
+
+# Campos de `xdotool getwindowgeometry --shell` (X/Y pueden ser negativos)
+_GEOM_RE = re.compile(rb"^(WINDOW|X|Y|WIDTH|HEIGHT)=(-?\d+)$", re.M)
+
+# ------------------------------------------------
+#  libxdo: el mismo motor que usa xdotool, pero cargado en proceso.
+#  Evita un fork+exec+XOpenDisplay por cada búsqueda/geometría/clic.
+#  Si la librería no está instalada se usa el binario `xdotool`.
+# ------------------------------------------------
+try:
+    _xdo = ctypes.CDLL("libxdo.so.3")
+except OSError:
+    _xdo = None
+
+SEARCH_CLASS = 1 << 1
+SEARCH_ONLYVISIBLE = 1 << 4
+CURRENTWINDOW = 0
+
+if _xdo is not None:
+    _xdo.xdo_version.restype = c_char_p
+    # xdo_search_t ganó el campo "winrole" en xdotool 3.20210804
+    _xdo_version = _xdo.xdo_version().decode()
+    _has_winrole = int(_xdo_version.split(".")[1]) >= 20210804
+
+    class _XdoSearch(ctypes.Structure):
+        _fields_ = [
+            ("title", c_char_p),
+            ("winclass", c_char_p),
+            ("winclassname", c_char_p),
+            ("winname", c_char_p),
+        ] + ([("winrole", c_char_p)] if _has_winrole else []) + [
+            ("pid", c_int),
+            ("max_depth", c_long),
+            ("only_visible", c_int),
+            ("screen", c_int),
+            ("require", c_int),
+            ("searchmask", c_uint),
+            ("desktop", c_long),
+            ("limit", c_uint),
+        ]
+
+    _xdo.xdo_new.restype = c_void_p
+    _xdo.xdo_new.argtypes = [c_char_p]
+    _xdo.xdo_free.argtypes = [c_void_p]
+    _xdo.xdo_search_windows.argtypes = [
+        c_void_p, POINTER(_XdoSearch), POINTER(POINTER(c_ulong)), POINTER(c_uint)
+    ]
+    _xdo.xdo_get_window_location.argtypes = [
+        c_void_p, c_ulong, POINTER(c_int), POINTER(c_int), c_void_p
+    ]
+    _xdo.xdo_get_window_size.argtypes = [c_void_p, c_ulong, POINTER(c_uint), POINTER(c_uint)]
+    _xdo.xdo_move_mouse_relative_to_window.argtypes = [c_void_p, c_ulong, c_int, c_int]
+    _xdo.xdo_click_window.argtypes = [c_void_p, c_ulong, c_int]
+    _xdo.xdo_enter_text_window.argtypes = [c_void_p, c_ulong, c_char_p, c_uint]
+
+    # Varias sesiones sobre el mismo DISPLAY comparten el xdo_t (y su Display*)
+    # desde hilos distintos: Xlib debe inicializarse en modo multihilo.
+    ctypes.CDLL("libX11.so.6").XInitThreads()
+
+# libc: free() para las listas de libxdo, SysV SHM para MIT-SHM e inotify
+# para seguir los sockets de /tmp/.X11-unix
+_libc = ctypes.CDLL(None, use_errno=True)
+_libc.free.argtypes = [c_void_p]
+_libc.inotify_init1.argtypes = [c_int]
+_libc.inotify_add_watch.argtypes = [c_int, c_char_p, c_uint]
+_libc.shmget.argtypes = [c_int, c_size_t, c_int]
+_libc.shmget.restype = c_int
+_libc.shmat.argtypes = [c_int, c_void_p, c_int]
+_libc.shmat.restype = c_void_p
+_libc.shmdt.argtypes = [c_void_p]
+_libc.shmctl.argtypes = [c_int, c_int, c_void_p]
+
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_RMID = 0
+SHM_RDONLY = 0o10000
+
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_Q_OVERFLOW = 0x4000
+IN_CLOEXEC = 0o2000000
+
+# Un xdo_t* (una conexión Xlib) por DISPLAY, creado bajo demanda
+_xdo_handles = {}
+_xdo_handles_lock = Lock()
+
+
+def _get_xdo(display):
+    """
+    Devuelve el xdo_t* asociado al DISPLAY, abriéndolo la primera vez.
+    """
+    with _xdo_handles_lock:
+        xdo = _xdo_handles.get(display)
+        if xdo is None:
+            xdo = _xdo.xdo_new(display.encode())
+            if not xdo:
+                raise RuntimeError(f"libxdo no pudo abrir el DISPLAY {display}.")
+            _xdo_handles[display] = xdo
+        return xdo
+
+
+def _release_xdo(display):
+    """
+    Cierra la conexión libxdo de un DISPLAY (si existe).
+    """
+    with _xdo_handles_lock:
+        xdo = _xdo_handles.pop(display, None)
+    if xdo:
+        _xdo.xdo_free(xdo)
+
+
+class _Capturer:
+    """
+    Captura regiones de la pantalla con la extensión MIT-SHM: el servidor X
+    escribe los píxeles directamente en un segmento de memoria compartida
+    (sin copiarlos por el socket). El segmento se dimensiona para la pantalla
+    completa y se reutiliza entre capturas: cambiar el tamaño de la ventana
+    no obliga a recrearlo (solo crece si una región no cupiera).
+    """
+
+    def __init__(self, display):
+        self.conn = xcffib.connect(display=display)
+        try:
+            self.shm = self.conn(xcffib.shm.key)
+            self.shm.QueryVersion().reply()
+            screen = self.conn.get_setup().roots[self.conn.pref_screen]
+            if screen.root_depth not in (24, 32):
+                raise RuntimeError(f"Profundidad de color no soportada: {screen.root_depth}")
+        except Exception:
+            self.conn.disconnect()
+            raise
+        self.root = screen.root
+        self.screen_size = screen.width_in_pixels * screen.height_in_pixels * 4
+        self.seg = None
+        self.addr = None
+        self.size = 0
+        self.buf = None
+
+    def _alloc(self, size):
+        self._free()
+        shmid = _libc.shmget(IPC_PRIVATE, size, IPC_CREAT | 0o600)
+        if shmid < 0:
+            raise OSError(ctypes.get_errno(), "shmget falló")
+        addr = _libc.shmat(shmid, None, 0)
+        # Marcado para borrar: desaparece cuando ambos lados se desacoplen
+        _libc.shmctl(shmid, IPC_RMID, None)
+        if addr is None or addr == c_void_p(-1).value:
+            raise OSError(ctypes.get_errno(), "shmat falló")
+        seg = self.conn.generate_id()
+        try:
+            self.shm.AttachChecked(seg, shmid, False).check()
+        except Exception:
+            _libc.shmdt(addr)
+            raise
+        self.seg, self.addr, self.size = seg, addr, size
+        self.buf = (c_char * size).from_address(addr)
+
+    def _free(self):
+        if self.seg is not None:
+            self.shm.Detach(self.seg)
+            self.conn.flush()
+            self.seg = None
+        if self.addr is not None:
+            self.buf = None
+            _libc.shmdt(self.addr)
+            self.addr = None
+            self.size = 0
+
+    def _get_image(self, x, y, width, height):
+        """
+        Pide la región al servidor y devuelve un memoryview de sus píxeles
+        BGRX dentro del segmento (válido hasta la siguiente captura).
+        """
+        size = width * height * 4
+        if size > self.size:
+            self._alloc(max(size, self.screen_size))
+        # reply() bloquea hasta que el servidor terminó de escribir el segmento
+        self.shm.GetImage(
+            self.root, x, y, width, height, 0xFFFFFFFF,
+            xcffib.xproto.ImageFormat.ZPixmap, self.seg, 0
+        ).reply()
+        return memoryview(self.buf).cast("B")[:size]
+
+    def capture(self, x, y, width, height):
+        """
+        Devuelve una PIL.Image RGB con la región (x, y, width, height) de la raíz.
+        """
+        # El reordenado BGRX -> RGB lo hace el desempaquetador "raw" de PIL (C)
+        # mientras copia cada fila; no hay una pasada aparte sobre los píxeles.
+        return Image.frombuffer(
+            "RGB", (width, height), self._get_image(x, y, width, height), "raw", "BGRX", 0, 1
+        )
+
+    def pixels(self, x, y, width, height):
+        """
+        Igual que capture, pero como array numpy (height, width, 4) BGRX sin
+        copiar: apunta al segmento, así que hay que usarlo antes de la
+        siguiente captura.
+        """
+        return numpy.frombuffer(
+            self._get_image(x, y, width, height), numpy.uint8
+        ).reshape(height, width, 4)
+
+    def close(self):
+        try:
+            self._free()
+        finally:
+            self.conn.disconnect()
+
+
+class _XvfbFramebuffer:
+    """
+    Acceso directo al framebuffer de un Xvfb lanzado con -shmem.
+    Xvfb guarda la pantalla como un volcado XWD (cabecera + mapa de colores
+    + píxeles) en un segmento SysV; aquí se adjunta en solo lectura y cada
+    captura recorta la ventana sin pedir nada al servidor X (cero copias
+    hasta el decodificador de PIL).
+    """
+
+    def __init__(self, pid_xvfb):
+        shmid, size = self._find_segment(pid_xvfb)
+        addr = _libc.shmat(shmid, None, SHM_RDONLY)
+        if addr is None or addr == c_void_p(-1).value:
+            raise OSError(ctypes.get_errno(), "shmat falló")
+        self.addr = addr
+        self.mem = memoryview((c_char * size).from_address(addr)).cast("B")
+
+        # La cabecera XWD está en big-endian; los píxeles en el orden nativo
+        header = struct.unpack(">25I", self.mem[:100])
+        header_size, bits_per_pixel, bytes_per_line = header[0], header[11], header[12]
+        byte_order, red_mask, ncolors = header[7], header[14], header[19]
+        if bits_per_pixel != 32 or byte_order != 0 or red_mask != 0xFF0000:
+            self.close()
+            raise RuntimeError("Formato de framebuffer Xvfb no soportado.")
+        self.width, self.height = header[4], header[5]
+        self.stride = bytes_per_line
+        self.offset = header_size + ncolors * 12  # sizeof(XWDColor) == 12
+
+    @staticmethod
+    def _find_segment(pid_xvfb):
+        """
+        Devuelve (shmid, size) del segmento creado por el proceso Xvfb,
+        buscándolo por cpid en /proc/sysvipc/shm.
+        """
+        with open("/proc/sysvipc/shm") as f:
+            columnas = f.readline().split()
+            for linea in f:
+                fila = dict(zip(columnas, linea.split()))
+                if int(fila["cpid"]) == pid_xvfb:
+                    return int(fila["shmid"]), int(fila["size"])
+        raise RuntimeError(f"Xvfb (pid {pid_xvfb}) no tiene framebuffer en memoria compartida.")
+
+    def capture(self, x, y, width, height):
+        """
+        Devuelve una PIL.Image RGB con la región pedida, o None si la región
+        se sale de la pantalla.
+        """
+        if x < 0 or y < 0 or x + width > self.width or y + height > self.height:
+            return None
+        start = self.offset + y * self.stride + x * 4
+        end = start + (height - 1) * self.stride + width * 4
+        return Image.frombuffer(
+            "RGB", (width, height), self.mem[start:end], "raw", "BGRX", self.stride, 1
+        )
+
+    def pixels(self, x, y, width, height):
+        """
+        Array numpy (height, width, 4) BGRX que apunta directamente al
+        framebuffer (con el stride de la pantalla), o None si la región se
+        sale de la pantalla.
+        """
+        if x < 0 or y < 0 or x + width > self.width or y + height > self.height:
+            return None
+        return numpy.ndarray(
+            (height, width, 4), numpy.uint8, buffer=self.mem,
+            offset=self.offset + y * self.stride + x * 4,
+            strides=(self.stride, 4, 1)
+        )
+
+    def close(self):
+        if self.addr is not None:
+            self.mem.release()
+            _libc.shmdt(self.addr)
+            self.addr = None
+
+
+def _release_xvfb_segment(pid_xvfb):
+    """
+    Marca para borrado (IPC_RMID) el framebuffer en memoria compartida de
+    Xvfb. Xvfb y los _XvfbFramebuffer ya adjuntos lo siguen usando (Linux
+    permite incluso adjuntarlo después); el kernel lo libera cuando el
+    último se desacopla, aunque Xvfb muera con SIGKILL sin limpiar.
+    """
+    try:
+        shmid, _ = _XvfbFramebuffer._find_segment(pid_xvfb)
+    except (OSError, RuntimeError):
+        return
+    _libc.shmctl(shmid, IPC_RMID, None)
+
+
+def _get_framebuffer(session_info):
+    """
+    Devuelve el _XvfbFramebuffer de la sesión (solo si arrancamos su Xvfb),
+    abriéndolo la primera vez. Retorna None si no está disponible.
+    """
+    framebuffer = session_info.get("_framebuffer")
+    if framebuffer is None:
+        framebuffer = False
+        if session_info.get("pid_xvfb"):
+            try:
+                framebuffer = _XvfbFramebuffer(session_info["pid_xvfb"])
+            except Exception:
+                framebuffer = False
+        session_info["_framebuffer"] = framebuffer
+    return framebuffer or None
+
+
+def _get_capturer(session_info):
+    """
+    Devuelve el _Capturer MIT-SHM de la sesión, creándolo la primera vez.
+    Retorna None si xcffib no está instalado o el servidor X no soporta
+    MIT-SHM (en ese caso se usa PIL.ImageGrab).
+    """
+    capturer = session_info.get("_capturer")
+    if capturer is None:
+        capturer = False
+        if xcffib is not None:
+            try:
+                capturer = _Capturer(session_info["display"])
+            except Exception:
+                capturer = False
+        session_info["_capturer"] = capturer
+    return capturer or None
+
+
+# ------------------------------------------------
+#  Procesos hijos (Xvfb y Chrome): terminación y reapeo
+# ------------------------------------------------
+# Segundos de gracia tras SIGTERM antes de escalar a SIGKILL
+STOP_GRACE = 0.2
+
+# PIDs de Xvfb/Chrome lanzados por este módulo que aún no se han reapeado.
+# Solo se reapean estos: un waitpid(-1) le robaría el estado de salida a
+# los subprocess.check_output de xdotool.
+_children = set()
+
+
+def _reap(pid):
+    """
+    Recoge el estado de un hijo propio sin bloquear.
+    Retorna True si ya terminó (reapeado aquí o antes).
+    """
+    if pid not in _children:
+        return True
+    try:
+        done, _ = os.waitpid(pid, os.WNOHANG)
+    except ChildProcessError:
+        done = pid
+    if done == pid:
+        _children.discard(pid)
+        return True
+    return False
+
+
+def _reap_children(signum=None, frame=None):
+    for pid in list(_children):
+        _reap(pid)
+
+
+def _pidfd_exited(pidfd, timeout):
+    """
+    True si el proceso del pidfd terminó (el pidfd se vuelve legible),
+    esperando como mucho timeout segundos. Usa poll() y no select(), que
+    falla con descriptores >= FD_SETSIZE (1024).
+    """
+    poller = select.poll()
+    poller.register(pidfd, select.POLLIN)
+    return bool(poller.poll(timeout * 1000))
+
+
+def _terminate_child(pid, pidfd=None):
+    """
+    SIGTERM, espera hasta STOP_GRACE y, si sigue vivo, SIGKILL.
+    Con el pidfd del proceso las señales se envían a través de él (no pueden
+    alcanzar a otro proceso que haya heredado el PID) y la espera es un
+    poll() sobre el pidfd; sin él, se sondea con waitpid(WNOHANG).
+    """
+    try:
+        if pidfd is not None:
+            signal.pidfd_send_signal(pidfd, signal.SIGTERM)
+        else:
+            os.kill(pid, signal.SIGTERM)
+    except OSError:
+        _reap(pid)
+        return
+    if pidfd is not None:
+        if _pidfd_exited(pidfd, STOP_GRACE):
+            _reap(pid)
+            return
+    else:
+        deadline = time.monotonic() + STOP_GRACE
+        while time.monotonic() < deadline:
+            if _reap(pid):
+                return
+            time.sleep(0.01)
+    try:
+        if pidfd is not None:
+            signal.pidfd_send_signal(pidfd, signal.SIGKILL)
+        else:
+            os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+    except (OSError, ChildProcessError):
+        pass
+    _children.discard(pid)
+
+
+def _open_pidfd(pid):
+    """
+    pidfd del proceso (Linux >= 5.3, Python >= 3.9) o None si no está disponible.
+    """
+    try:
+        return os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        return None
+
+
+def _check_chrome_alive(session_info):
+    """
+    Lanza RuntimeError si Chrome ya terminó. Con pidfd basta un poll()
+    sin espera (legible == el proceso salió), sin riesgo de que el PID se
+    haya reutilizado y detectando también a Chrome como zombie sin reapear;
+    sin pidfd se recurre a os.kill(pid, 0).
+    """
+    pidfd = session_info.get("_chrome_pidfd")
+    if pidfd is not None:
+        muerto = _pidfd_exited(pidfd, 0)
+    else:
+        try:
+            os.kill(session_info["pid_chrome"], 0)
+            muerto = False
+        except OSError:
+            muerto = True
+    if muerto:
+        raise RuntimeError("El proceso de Chrome ya no existe en Linux.")
+
+
+# signal.signal solo puede llamarse desde el hilo principal
+if threading.current_thread() is threading.main_thread():
+    signal.signal(signal.SIGCHLD, _reap_children)
+
+
+X11_SOCKET_DIR = "/tmp/.X11-unix"
+
+# Displays con socket en X11_SOCKET_DIR, mantenido al día por un hilo que
+# lee eventos inotify. None mientras no haya watch (se escanea cada vez).
+_busy_displays = None
+
+
+def _scan_busy_displays():
+    """
+    Displays ocupados: los que tienen socket en /tmp/.X11-unix y los que
+    tienen lock en /tmp/.X<n>-lock (un servidor X lo crea al arrancar, antes
+    que el socket). Dos listdir en total, sin pgrep ni recorrer /proc.
+    """
+    busy = set()
+    try:
+        for nombre in os.listdir(X11_SOCKET_DIR):
+            if nombre[:1] == "X" and nombre[1:].isdigit():
+                busy.add(int(nombre[1:]))
+    except FileNotFoundError:
+        pass
+    for nombre in os.listdir("/tmp"):
+        if nombre.startswith(".X") and nombre.endswith("-lock") and nombre[2:-5].isdigit():
+            busy.add(int(nombre[2:-5]))
+    return busy
+
+
+def _watch_displays():
+    """
+    Arranca (una vez) el watch inotify sobre /tmp/.X11-unix y el hilo que
+    actualiza _busy_displays. Si el directorio aún no existe o inotify no
+    está disponible, no hace nada y find_free_display sigue escaneando.
+    """
+    global _busy_displays
+    if _busy_displays is not None:
+        return
+    fd = _libc.inotify_init1(IN_CLOEXEC)
+    if fd < 0:
+        return
+    mask = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+    if _libc.inotify_add_watch(fd, X11_SOCKET_DIR.encode(), mask) < 0:
+        os.close(fd)
+        return
+    # El estado inicial se lee después de crear el watch para no perder eventos
+    _busy_displays = _scan_busy_displays()
+    threading.Thread(target=_display_watcher, args=(fd,), daemon=True).start()
+
+
+def _display_watcher(fd):
+    global _busy_displays
+    while True:
+        data = os.read(fd, 4096)
+        offset = 0
+        while offset < len(data):
+            _, event_mask, _, name_len = struct.unpack_from("iIII", data, offset)
+            name = data[offset + 16:offset + 16 + name_len].rstrip(b"\0")
+            offset += 16 + name_len
+            if event_mask & IN_Q_OVERFLOW:
+                # Se perdieron eventos: reescanear y sustituir el conjunto con
+                # _display_alloc_lock tomado (find_free_display nunca ve un
+                # conjunto vacío ni a medio rellenar, y un Xvfb que se está
+                # arrancando ya tiene su socket al soltar el lock)
+                with _display_alloc_lock:
+                    _busy_displays = _scan_busy_displays()
+            elif name[:1] == b"X" and name[1:].isdigit():
+                if event_mask & (IN_CREATE | IN_MOVED_TO):
+                    _busy_displays.add(int(name[1:]))
+                else:
+                    _busy_displays.discard(int(name[1:]))
 
 
 def find_free_display():
     """
-    Busca un DISPLAY libre para Xvfb, probando ":1", ":2", ...
+    Busca un DISPLAY libre para Xvfb (":1", ":2", ...) y lo marca como ocupado.
+    Con el watch inotify activo basta consultar _busy_displays; si no, se
+    escanean sockets y locks (_scan_busy_displays). Debe llamarse con _display_alloc_lock.
     Retorna el primer display disponible.
     """
+    _watch_displays()
+    busy = _busy_displays if _busy_displays is not None else _scan_busy_displays()
     for n in range(1, 100):
-        d = f":{n}"
-        socket_path = Path(f"/tmp/.X11-unix/X{n}")
-        if socket_path.exists():
-            continue
-        # Verificamos que no haya un proceso Xvfb corriendo en ese display
-        if subprocess.call(
-            ["pgrep", "-f", f"Xvfb {d}"],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        ) == 0:
-            continue
-        return d
+        if n not in busy:
+            busy.add(n)
+            return f":{n}"
     raise RuntimeError("No se encontró ningún DISPLAY libre para Xvfb.")
 
 
+# ------------------------------------------------
+#  Pool de sesiones precalentadas (ver prewarm)
+# ------------------------------------------------
+_pool = None
+_pool_slots = None
+_pool_closed = False
+
+
+def prewarm(n):
+    """
+    Mantiene hasta n sesiones Xvfb+Chrome ya arrancadas para que
+    start_chrome_linux las entregue al instante. Un hilo en segundo plano
+    repone el pool cada vez que se saca una sesión. Llamar una vez al arrancar.
+    Solo con Xvfb: si hay $DISPLAY, todos los Chrome compartirían pantalla y
+    una sesión podría encontrar la ventana de un Chrome del pool.
+    Al salir del proceso, las sesiones del pool se paran (atexit).
+    """
+    global _pool, _pool_slots
+    if n <= 0 or _pool is not None or os.environ.get("DISPLAY"):
+        return
+    _pool = queue.LifoQueue(maxsize=n)
+    _pool_slots = threading.Semaphore(n)
+    atexit.register(_drain_pool)
+    threading.Thread(target=_pool_filler, name="chrome-pool", daemon=True).start()
+
+
+def _pool_filler():
+    while True:
+        _pool_slots.acquire()
+        if _pool_closed:
+            return
+        try:
+            session_info = _build_session_blocking()
+        except Exception:
+            traceback.print_exc()
+            _pool_slots.release()
+            time.sleep(5)
+            continue
+        if _pool_closed:
+            # El proceso está saliendo: no dejarla huérfana en el pool
+            stop_session_linux(session_info)
+            return
+        _pool.put(session_info)
+
+
+def _drain_pool():
+    """
+    Para todas las sesiones que siguen en el pool (registrado con atexit).
+    """
+    global _pool_closed
+    _pool_closed = True
+    while True:
+        try:
+            session_info = _pool.get_nowait()
+        except queue.Empty:
+            return
+        try:
+            stop_session_linux(session_info)
+        except Exception:
+            traceback.print_exc()
+
+
 def start_chrome_linux():
+    """
+    Devuelve una sesión remota de Chrome en Linux: una del pool precalentado
+    si hay alguna viva, o una nueva creada con _build_session_blocking().
+    """
+    if _pool is not None:
+        while True:
+            try:
+                session_info = _pool.get(timeout=0.05)
+            except queue.Empty:
+                break
+            _pool_slots.release()
+            try:
+                _check_chrome_alive(session_info)
+                return session_info
+            except RuntimeError:
+                # Chrome murió mientras esperaba en el pool
+                stop_session_linux(session_info)
+    return _build_session_blocking()
+
+
+def _build_session_blocking():
     """
     Inicia una sesión remota de Chrome en Linux:
       1) Si ya existe $DISPLAY, se usa ese.
       2) Si no, se arranca Xvfb en un display libre.
       3) Se lanza Chrome con --start-maximized en el DISPLAY elegido.
-      4) Se espera a que abra la ventana y se busca con xdotool.
+      4) Se busca la ventana cada 50 ms hasta que aparezca (máx. 10 s).
       5) Si falla, mata procesos y lanza RuntimeError.
       6) Devuelve un dict con:
          {
-           "session_id": <uuid>,
+           "session_id": <hex de 16 caracteres>,
            "pid_xvfb": <pid> o None,
            "pid_chrome": <pid>,
            "display": display,
@@ -51,84 +697,138 @@ def start_chrome_linux():
            "geometry": (x, y, width, height)
          }
     """
-    with lock:
-        # 1) Determinar qué DISPLAY usar
-        current_display = os.environ.get("DISPLAY")
-        usar_xvfb = False
-        xvfb_proc = None
+    # 1) Determinar qué DISPLAY usar
+    current_display = os.environ.get("DISPLAY")
+    usar_xvfb = False
+    xvfb_proc = None
 
-        if current_display:
-            display = current_display
-        else:
+    if current_display:
+        display = current_display
+    else:
+        # Elegir display y arrancar Xvfb de forma atómica: dos sesiones que
+        # arrancan a la vez no deben quedarse con el mismo display
+        with _display_alloc_lock:
             display = find_free_display()
             usar_xvfb = True
             xvfb_proc = subprocess.Popen(
-                ["Xvfb", display, "-screen", "0", "1920x1080x24"],
+                [XVFB_EXE, display, "-screen", "0", "1920x1080x24", "-shmem"],
                 stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL
+                stderr=subprocess.DEVNULL,
+                close_fds=False
             )
-            time.sleep(1)
-
-        # 2) Lanzar Chrome maximizado en ese DISPLAY
-        env = os.environ.copy()
-        env["DISPLAY"] = display
-
-        chrome_exe = "/usr/bin/google-chrome"
-        chrome_cmd = [
-            chrome_exe,
-            "--no-sandbox",
-            "--disable-gpu",
-            "--start-maximized",
-            "about:blank"
-        ]
-        chrome_proc = subprocess.Popen(
-            chrome_cmd,
-            env=env,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
+            _children.add(xvfb_proc.pid)
 
-        # 3) Esperar a que Chrome abra la ventana (6 s)
-        time.sleep(6)
+            # Esperar a que Xvfb cree su socket (máx. 5 s) en vez de dormir fijo
+            socket_path = Path(X11_SOCKET_DIR) / f"X{display[1:]}"
+            deadline = time.monotonic() + 5
+            while not socket_path.exists():
+                if time.monotonic() >= deadline or xvfb_proc.poll() is not None:
+                    _terminate_child(xvfb_proc.pid)
+                    if _busy_displays is not None:
+                        _busy_displays.discard(int(display[1:]))
+                    raise RuntimeError(f"Xvfb no arrancó en DISPLAY {display}.")
+                time.sleep(0.05)
 
-        # 4) Buscar la ventana de Chrome con xdotool
-        window_id = _find_chrome_window_xdotool(display)
-        if window_id is None:
-            try:
-                chrome_proc.terminate()
-            except Exception:
-                pass
-            if usar_xvfb and xvfb_proc:
-                try:
-                    xvfb_proc.terminate()
-                except Exception:
-                    pass
-            raise RuntimeError(f"No se detectó la ventana de Chrome en DISPLAY {display}.")
+        # Xvfb crea el framebuffer antes de abrir el socket: marcarlo ya para
+        # borrado, así no queda huérfano aunque la sesión falle o nunca capture
+        _release_xvfb_segment(xvfb_proc.pid)
+
+    # 2) Lanzar Chrome maximizado en ese DISPLAY
+    #    (el env se construye una sola vez y la sesión lo reutiliza)
+    env = {**os.environ, "DISPLAY": display}
+
+    # Perfil propio por sesión: si no, un segundo Chrome delega en el
+    # primero (singleton por perfil) y termina enseguida. Se borra al parar.
+    profile_dir = f"/tmp/remote-profile-{os.getpid()}-{next(_profile_counter)}"
+    chrome_cmd = [
+        CHROME_EXE,
+        "--no-sandbox",
+        "--disable-gpu",
+        "--start-maximized",
+        f"--user-data-dir={profile_dir}",
+        "about:blank"
+    ]
+    chrome_proc = subprocess.Popen(
+        chrome_cmd,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        close_fds=False
+    )
+    _children.add(chrome_proc.pid)
+
+    # 3-4) Buscar la ventana de Chrome cada 50 ms hasta que aparezca (máx. 10 s)
+    window_id = _wait_for_chrome_window(display, env, chrome_proc)
+    if window_id is None:
+        _terminate_child(chrome_proc.pid)
+        if usar_xvfb and xvfb_proc:
+            # El display se reutilizará: no dejar un Display* de libxdo
+            # apuntando al Xvfb muerto
+            _release_xdo(display)
+            _terminate_child(xvfb_proc.pid)
+        shutil.rmtree(profile_dir, ignore_errors=True)
+        raise RuntimeError(f"No se detectó la ventana de Chrome en DISPLAY {display}.")
 
-        # 5) Obtener la geometría completa (x, y, width, height)
-        x, y, width, height = _get_window_geometry_xdotool(display, window_id)
+    # 5) Obtener la geometría completa (x, y, width, height)
+    x, y, width, height = _get_window_geometry_xdotool(display, window_id, env)
 
-        session_id = str(uuid.uuid4())
-        return {
-            "session_id": session_id,
-            "pid_xvfb": xvfb_proc.pid if usar_xvfb else None,
-            "pid_chrome": chrome_proc.pid,
-            "display": display,
-            "window_id": window_id,
-            "geometry": (x, y, width, height)
-        }
+    session_id = secrets.token_hex(8)
+    return {
+        "session_id": session_id,
+        "pid_xvfb": xvfb_proc.pid if usar_xvfb else None,
+        "pid_chrome": chrome_proc.pid,
+        "_chrome_pidfd": _open_pidfd(chrome_proc.pid),
+        "_xvfb_pidfd": _open_pidfd(xvfb_proc.pid) if usar_xvfb else None,
+        "display": display,
+        "_env": env,
+        "_profile_dir": profile_dir,
+        "_lock": Lock(),
+        "window_id": window_id,
+        "geometry": (x, y, width, height),
+        "_geom_cached_at": time.monotonic(),
+        "_geom_ttl": GEOMETRY_TTL
+    }
+
+
+def _wait_for_chrome_window(display, env, chrome_proc, timeout=10.0, interval=0.05):
+    """
+    Busca la ventana de Chrome cada `interval` segundos hasta que aparezca.
+    Retorna el window_id en cuanto existe, o None si pasan `timeout`
+    segundos o Chrome termina antes de mapear su ventana.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        window_id = _find_chrome_window_xdotool(display, env)
+        if window_id is not None or time.monotonic() >= deadline or chrome_proc.poll() is not None:
+            return window_id
+        time.sleep(interval)
 
 
-def _find_chrome_window_xdotool(display):
+def _find_chrome_window_xdotool(display, env):
     """
-    Usa `xdotool search --onlyvisible --class chrome` en el DISPLAY dado.
-    Retorna el primer window_id encontrado o None.
+    Equivalente a `xdotool search --onlyvisible --class chrome` en el DISPLAY dado.
+    Usa libxdo si está disponible; si no, el binario xdotool.
+    Retorna el primer window_id encontrado (str) o None.
     """
-    env = os.environ.copy()
-    env["DISPLAY"] = display
+    if _xdo is not None:
+        search = _XdoSearch()
+        search.winclass = b"chrome"
+        search.only_visible = 1
+        search.max_depth = -1
+        search.screen = 0
+        search.searchmask = SEARCH_CLASS | SEARCH_ONLYVISIBLE
+        windows = POINTER(c_ulong)()
+        nwindows = c_uint(0)
+        _xdo.xdo_search_windows(_get_xdo(display), byref(search), byref(windows), byref(nwindows))
+        try:
+            return str(windows[0]) if nwindows.value else None
+        finally:
+            if windows:
+                _libc.free(windows)
+
     try:
         salida = subprocess.check_output(
-            ["xdotool", "search", "--onlyvisible", "--class", "chrome"],
+            _XDOTOOL_SEARCH,
             env=env,
             encoding="utf-8"
         ).strip().splitlines()
@@ -138,177 +838,454 @@ def _find_chrome_window_xdotool(display):
     return salida[0].strip() if salida else None
 
 
-def _get_window_geometry_xdotool(display, window_id):
+def _get_window_geometry_xdotool(display, window_id, env):
     """
-    Llama a `xdotool getwindowgeometry --shell <window_id>` en el DISPLAY.
-    Parsear la salida para devolver (x, y, width, height).
+    Equivalente a `xdotool getwindowgeometry --shell <window_id>` en el DISPLAY.
+    Usa libxdo si está disponible; si no, parsea la salida del binario.
+    Devuelve (x, y, width, height).
     """
-    env = os.environ.copy()
-    env["DISPLAY"] = display
+    if _xdo is not None:
+        xdo = _get_xdo(display)
+        wid = int(window_id)
+        x, y = c_int(0), c_int(0)
+        width, height = c_uint(0), c_uint(0)
+        if (_xdo.xdo_get_window_location(xdo, wid, byref(x), byref(y), None) != 0
+                or _xdo.xdo_get_window_size(xdo, wid, byref(width), byref(height)) != 0):
+            raise RuntimeError("No se pudo obtener geometría de la ventana con libxdo.")
+        return (x.value, y.value, width.value, height.value)
+
     try:
         salida = subprocess.check_output(
-            ["xdotool", "getwindowgeometry", "--shell", window_id],
-            env=env,
-            encoding="utf-8"
+            (XDOTOOL_EXE, "getwindowgeometry", "--shell", window_id),
+            env=env
         )
     except subprocess.CalledProcessError:
         raise RuntimeError("No se pudo obtener geometría de la ventana con xdotool.")
 
-    x = y = width = height = None
-    for linea in salida.splitlines():
-        if linea.startswith("X="):
-            x = int(linea.split("=", 1)[1])
-        elif linea.startswith("Y="):
-            y = int(linea.split("=", 1)[1])
-        elif linea.startswith("WIDTH="):
-            width = int(linea.split("=", 1)[1])
-        elif linea.startswith("HEIGHT="):
-            height = int(linea.split("=", 1)[1])
-    if None in (x, y, width, height):
-        raise RuntimeError("Salida inesperada de getwindowgeometry: " + salida)
-    return (x, y, width, height)
+    campos = dict(_GEOM_RE.findall(salida))
+    try:
+        return (int(campos[b"X"]), int(campos[b"Y"]),
+                int(campos[b"WIDTH"]), int(campos[b"HEIGHT"]))
+    except KeyError:
+        raise RuntimeError("Salida inesperada de getwindowgeometry: " + salida.decode(errors="replace"))
+
+
+def _find_and_measure_chrome(display, env):
+    """
+    Busca la ventana de Chrome y obtiene su geometría en un solo paso.
+    Con libxdo son dos llamadas en proceso; sin libxdo, un único `xdotool`
+    que encadena search + getwindowgeometry (un fork en lugar de dos).
+    Retorna (window_id, x, y, width, height) o None si no hay ventana.
+    """
+    if _xdo is not None:
+        window_id = _find_chrome_window_xdotool(display, env)
+        if window_id is None:
+            return None
+        return (window_id,) + _get_window_geometry_xdotool(display, window_id, env)
+
+    try:
+        salida = subprocess.check_output(
+            _XDOTOOL_SEARCH_GEOMETRY,
+            env=env
+        )
+    except subprocess.CalledProcessError:
+        return None
+
+    campos = dict(_GEOM_RE.findall(salida))
+    try:
+        return (
+            campos[b"WINDOW"].decode(),
+            int(campos[b"X"]), int(campos[b"Y"]),
+            int(campos[b"WIDTH"]), int(campos[b"HEIGHT"])
+        )
+    except KeyError:
+        raise RuntimeError("Salida inesperada de getwindowgeometry: " + salida.decode(errors="replace"))
+
+
+def _find_and_measure_chrome_xcb(conn, root):
+    """
+    Igual que _find_and_measure_chrome, pero sobre una conexión xcffib ya
+    abierta (la del _Capturer de la sesión), sin lanzar procesos.
+    Recorre el árbol de ventanas nivel a nivel, enviando todas las peticiones
+    de un nivel antes de leer las respuestas (un viaje de ida y vuelta por
+    nivel), y se queda con la primera ventana visible cuyo WM_CLASS contiene
+    "chrome". Retorna (window_id, x, y, width, height) o None.
+    """
+    proto = conn.core
+    nivel = list(proto.QueryTree(root).reply().children)
+    while nivel:
+        attrs = [proto.GetWindowAttributes(w) for w in nivel]
+        clases = [
+            proto.GetProperty(False, w, xcffib.xproto.Atom.WM_CLASS,
+                              xcffib.xproto.Atom.STRING, 0, 64)
+            for w in nivel
+        ]
+        hijos = [proto.QueryTree(w) for w in nivel]
+        siguiente = []
+        encontrada = None
+        for w, attr, clase, arbol in zip(nivel, attrs, clases, hijos):
+            # Se leen todas las respuestas del nivel aunque alguna falle (la
+            # ventana puede desaparecer mientras se recorre el árbol)
+            respuestas = []
+            for cookie in (attr, clase, arbol):
+                try:
+                    respuestas.append(cookie.reply())
+                except xcffib.xproto.WindowError:
+                    respuestas.append(None)
+            if None in respuestas:
+                continue
+            attr, clase, arbol = respuestas
+            siguiente.extend(arbol.children)
+            visible = attr.map_state == xcffib.xproto.MapState.Viewable
+            wm_class = clase.value.buf().lower()
+            if encontrada is None and visible and b"chrome" in wm_class:
+                encontrada = w
+        if encontrada is not None:
+            pos = proto.TranslateCoordinates(encontrada, root, 0, 0).reply()
+            geom = proto.GetGeometry(encontrada).reply()
+            return (str(encontrada), pos.dst_x, pos.dst_y, geom.width, geom.height)
+        nivel = siguiente
+    return None
+
+
+def _window_geometry(session_info, refresh=False):
+    """
+    Devuelve (window_id, (x, y, width, height)) de la ventana de Chrome.
+    Mientras no venza el TTL de la sesión se reutilizan los valores guardados
+    en session_info; si venció (o refresh=True) se vuelven a consultar.
+    """
+    now = time.monotonic()
+    cached_at = session_info.get("_geom_cached_at")
+    ttl = session_info.get("_geom_ttl", GEOMETRY_TTL)
+    if not refresh and cached_at is not None and now - cached_at < ttl:
+        return session_info["window_id"], session_info["geometry"]
+
+    display = session_info["display"]
+    # Sin libxdo, la conexión xcffib del capturador evita lanzar xdotool
+    capturer = _get_capturer(session_info) if _xdo is None else None
+    if capturer is not None:
+        found = _find_and_measure_chrome_xcb(capturer.conn, capturer.root)
+    else:
+        found = _find_and_measure_chrome(display, session_info["_env"])
+    if found is None:
+        session_info.pop("_geom_cached_at", None)
+        raise RuntimeError(f"No se encontró la ventana de Chrome en DISPLAY {display}.")
+    window_id, geometry = found[0], found[1:]
+
+    session_info["window_id"] = window_id
+    session_info["geometry"] = geometry
+    session_info["_geom_cached_at"] = now
+    return window_id, geometry
 
 
-def capture_window_linux(session_info, out_path=None):
+def capture_window_linux(session_info, max_width=None):
     """
     Captura la ventana completa de Chrome y devuelve un BytesIO con JPEG en memoria.
       1) Verifica que el proceso de Chrome siga vivo.
-      2) Busca la ventana nuevamente con xdotool (puede haberse movido).
-      3) Obtiene la geometría completa.
-      4) Hace ImageGrab.grab(bbox=(x,y,x+width,y+height)) usando el DISPLAY.
-      5) Genera un JPEG en un io.BytesIO (calidad 75) y lo retorna.
-      6) IGNORA el parámetro opcional 'out_path' (ya no se escribe PNG en disco).
+      2) Obtiene window_id y geometría (cacheados durante GEOMETRY_TTL).
+      3) Captura la región leyendo el framebuffer de Xvfb (-shmem); si el
+         display no es nuestro, con MIT-SHM, y en último caso con
+         ImageGrab.grab(bbox=...). Si falla, refresca la geometría y reintenta.
+      4) Genera un JPEG en un io.BytesIO (calidad 75) y lo retorna. Si hay
+         libjpeg-turbo y la región está en memoria compartida, 3 y 4 son un
+         único paso sin PIL.
+    Si se indica max_width y la ventana es más ancha, la imagen se reduce
+    (bilineal, manteniendo proporción) antes de codificarla.
     """
-    with lock:
-        display = session_info["display"]
-        pid_chrome = session_info["pid_chrome"]
-
+    with session_info["_lock"]:
         # 1) Verificar que Chrome siga vivo
-        try:
-            os.kill(pid_chrome, 0)
-        except OSError:
-            raise RuntimeError("El proceso de Chrome ya no existe en Linux.")
+        _check_chrome_alive(session_info)
 
-        # 2) Volver a encontrar el window_id (por si se movió)
-        window_id = _find_chrome_window_xdotool(display)
-        if window_id is None:
-            raise RuntimeError(f"No se encontró la ventana de Chrome al recapturar en DISPLAY {display}.")
-        session_info["window_id"] = window_id
+        for intento in range(2):
+            # 2) window_id y geometría (de caché salvo en el reintento)
+            window_id, (x, y, width, height) = _window_geometry(session_info, refresh=intento > 0)
 
-        # 3) Obtener geometría
-        x, y, width, height = _get_window_geometry_xdotool(display, window_id)
-        session_info["geometry"] = (x, y, width, height)
+            # 3) Capturar la región (con TurboJPEG se codifica aquí mismo,
+            #    directamente desde la memoria compartida)
+            try:
+                if not (max_width and width > max_width):
+                    jpeg = _grab_jpeg_turbo(session_info, x, y, width, height)
+                    if jpeg is not None:
+                        return jpeg
+                img = _grab_region(session_info, x, y, width, height)
+                break
+            except Exception:
+                if intento:
+                    raise
 
-        # 4) Capturar la pantalla con PIL.ImageGrab
-        bbox = (x, y, x + width, y + height)
-        os.environ["DISPLAY"] = display
-        img = ImageGrab.grab(bbox=bbox)
+    # 4) Convertir a JPEG en memoria y devolver el buffer. Fuera del lock:
+    # la imagen ya es una copia propia (PIL copia al reordenar BGRX -> RGB)
+    # y PIL libera el GIL al comprimir, así que clics y tecleo sobre la
+    # misma sesión no esperan a la compresión.
+    return _encode_jpeg(_scale(img, max_width), session_info.get("low_latency", True))
 
-        # 5) Convertir a JPEG en memoria
-        buf = io.BytesIO()
-        img.save(buf, format="JPEG", quality=75)
-        buf.seek(0)
 
-        # 6) Devolver el buffer con JPEG
-        return buf
+def _scale(img, max_width):
+    """
+    Reduce img (bilineal, manteniendo proporción) si es más ancha que max_width.
+    """
+    if max_width and img.width > max_width:
+        img = img.resize((max_width, max(1, img.height * max_width // img.width)), Image.BILINEAR)
+    return img
+
+
+def _grab_jpeg_turbo(session_info, x, y, width, height):
+    """
+    Codifica la región como JPEG con libjpeg-turbo leyendo los píxeles BGRX
+    directamente del framebuffer de Xvfb o del segmento MIT-SHM (sin la
+    copia a RGB de PIL). Retorna un io.BytesIO, o None si TurboJPEG no está
+    disponible o la región no está en memoria compartida.
+    Debe llamarse con el lock de la sesión tomado (el segmento MIT-SHM se
+    reutiliza en la siguiente captura).
+    """
+    if _tj is None:
+        return None
+    pixels = None
+    framebuffer = _get_framebuffer(session_info)
+    if framebuffer is not None:
+        pixels = framebuffer.pixels(x, y, width, height)
+    if pixels is None:
+        capturer = _get_capturer(session_info)
+        if capturer is None:
+            return None
+        try:
+            pixels = capturer.pixels(x, y, width, height)
+        except xcffib.XcffibException:
+            return None
+    # En modo progresivo libjpeg-turbo ya optimiza las tablas Huffman
+    flags = 0 if session_info.get("low_latency", True) else TJFLAG_PROGRESSIVE
+    return io.BytesIO(
+        _tj.encode(pixels, quality=75, pixel_format=TJPF_BGRX,
+                   jpeg_subsample=TJSAMP_420, flags=flags)
+    )
+
+
+def _grab_region(session_info, x, y, width, height):
+    """
+    Captura la región (x, y, width, height) del DISPLAY de la sesión como
+    PIL.Image RGB: framebuffer de Xvfb, MIT-SHM o PIL.ImageGrab, en ese orden.
+    """
+    framebuffer = _get_framebuffer(session_info)
+    if framebuffer is not None:
+        img = framebuffer.capture(x, y, width, height)
+        if img is not None:
+            return img
+
+    capturer = _get_capturer(session_info)
+    if capturer is not None:
+        try:
+            return capturer.capture(x, y, width, height)
+        except xcffib.XcffibException:
+            pass
+
+    # xdisplay abre el DISPLAY de la sesión sin tocar os.environ, que es
+    # compartido por todos los hilos.
+    return ImageGrab.grab(bbox=(x, y, x + width, y + height),
+                          xdisplay=session_info["display"])
 
 
 def click_window_linux(session_info, x_rel, y_rel):
     """
     Simula un clic izquierdo en coordenadas relativas (x_rel, y_rel)
     dentro de la ventana completa de Chrome:
-      1) Verifica proceso vivo y busca window_id.
-      2) Obtiene geometría completa.
+      1) Verifica proceso vivo.
+      2) Obtiene window_id y geometría (cacheados durante GEOMETRY_TTL).
       3) Calcula (x_abs, y_abs) = (x + x_rel, y + y_rel).
-      4) Usa `xdotool mousemove --window <window_id> <x_rel> <y_rel> click 1`.
+      4) Mueve el ratón relativo a la ventana y hace clic 1 (libxdo en proceso,
+         o `xdotool mousemove --window <window_id> <x_rel> <y_rel> click 1`).
+         Si falla o las coordenadas no caben, refresca la geometría y reintenta una vez.
       5) Retorna (x_abs, y_abs).
     """
-    with lock:
+    with session_info["_lock"]:
         display = session_info["display"]
-        pid_chrome = session_info["pid_chrome"]
-        try:
-            os.kill(pid_chrome, 0)
-        except OSError:
-            raise RuntimeError("El proceso de Chrome ya no existe en Linux.")
+        _check_chrome_alive(session_info)
 
-        window_id = _find_chrome_window_xdotool(display)
-        if window_id is None:
-            raise RuntimeError(f"No se encontró la ventana de Chrome al hacer clic en DISPLAY {display}.")
-        session_info["window_id"] = window_id
+        for intento in range(2):
+            window_id, (x, y, width, height) = _window_geometry(session_info, refresh=intento > 0)
 
-        x, y, width, height = _get_window_geometry_xdotool(display, window_id)
-        session_info["geometry"] = (x, y, width, height)
+            if not (0 <= x_rel < width and 0 <= y_rel < height):
+                # La geometría cacheada puede haber quedado vieja
+                if intento == 0:
+                    continue
+                raise ValueError(f"Coordenadas fuera de rango: ({x_rel}, {y_rel})")
 
-        if not (0 <= x_rel < width and 0 <= y_rel < height):
-            raise ValueError(f"Coordenadas fuera de rango: ({x_rel}, {y_rel})")
+            try:
+                _send_click(display, session_info["_env"], window_id, x_rel, y_rel)
+                break
+            except RuntimeError:
+                if intento:
+                    raise
 
         x_abs = x + x_rel
         y_abs = y + y_rel
+        return (x_abs, y_abs)
 
-        env = os.environ.copy()
-        env["DISPLAY"] = display
-        try:
-            subprocess.check_call(
-                [
-                    "xdotool", "mousemove", "--window", window_id, str(x_rel), str(y_rel), "click", "1"
-                ],
-                env=env
-            )
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"Error ejecutando xdotool: {e}")
 
-        return (x_abs, y_abs)
+def _encode_jpeg(img, low_latency=True):
+    """
+    Codifica la captura como JPEG (calidad 75, 4:2:0) en un io.BytesIO
+    posicionado al inicio.
+    low_latency=True: una sola pasada, baseline y tablas Huffman estándar.
+    low_latency=False: progresivo con tablas Huffman optimizadas; archivos
+    más pequeños (menos ancho de banda) a cambio de una pasada extra de CPU.
+    """
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=75, subsampling=2,
+             optimize=not low_latency, progressive=not low_latency)
+    buf.seek(0)
+    return buf
 
 
-def type_text_linux(session_info, text):
+def _send_click(display, env, window_id, x_rel, y_rel):
+    """
+    Mueve el ratón a (x_rel, y_rel) relativo a la ventana y hace clic izquierdo.
+    """
+    if _xdo is not None:
+        xdo = _get_xdo(display)
+        # El clic va a CURRENTWINDOW para que libxdo use XTEST (igual que
+        # `xdotool ... click 1`); con un window_id usaría XSendEvent.
+        if (_xdo.xdo_move_mouse_relative_to_window(xdo, int(window_id), x_rel, y_rel) != 0
+                or _xdo.xdo_click_window(xdo, CURRENTWINDOW, 1) != 0):
+            raise RuntimeError("Error ejecutando el clic con libxdo.")
+        return
+
+    try:
+        subprocess.check_call(
+            [
+                XDOTOOL_EXE, "mousemove", "--window", window_id, str(x_rel), str(y_rel), "click", "1"
+            ],
+            env=env
+        )
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Error ejecutando xdotool: {e}")
+
+
+def type_text_linux(session_info, text, delay_ms=0):
     """
     Envía texto a la ventana de Chrome:
       1) Verifica que el proceso de Chrome siga vivo.
-      2) Busca la ventana (window_id).
-      3) Llama a `xdotool type --window <window_id> --delay 100 "<text>"`.
+      2) Obtiene window_id (cacheado durante GEOMETRY_TTL, como en capturas y clics).
+      3) Escribe el texto con libxdo en proceso (xdo_enter_text_window), o con
+         `xdotool type --window <window_id> --delay <delay_ms> "<text>"` si no hay
+         libxdo. Por defecto sin retardo entre teclas; delay_ms > 0 simula
+         el ritmo de una persona.
+         No se reintenta (podría duplicar texto); si falla se invalida la
+         caché para que la próxima petición vuelva a buscar la ventana.
       4) Retorna True si tuvo éxito, lanza excepción si falla.
     """
-    with lock:
+    with session_info["_lock"]:
         display = session_info["display"]
-        pid_chrome = session_info["pid_chrome"]
+        _check_chrome_alive(session_info)
+
+        window_id, _ = _window_geometry(session_info)
         try:
-            os.kill(pid_chrome, 0)
-        except OSError:
-            raise RuntimeError("El proceso de Chrome ya no existe en Linux.")
+            _send_text(display, session_info["_env"], window_id, text, delay_ms)
+        except Exception:
+            session_info.pop("_geom_cached_at", None)
+            raise
+        return True
 
-        window_id = _find_chrome_window_xdotool(display)
-        if window_id is None:
-            raise RuntimeError(f"No se encontró la ventana de Chrome para enviar texto en DISPLAY {display}.")
 
-        env = os.environ.copy()
-        env["DISPLAY"] = display
-        try:
-            subprocess.check_call(
-                ["xdotool", "type", "--window", window_id, "--delay", "100", text],
-                env=env
-            )
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"Error enviando texto con xdotool: {e}")
+def _send_text(display, env, window_id, text, delay_ms=0):
+    """
+    Escribe el texto en la ventana con delay_ms milisegundos entre teclas
+    (0 = tan rápido como lo acepte el servidor X).
+    """
+    if _xdo is not None:
+        # xdotool recibe el retardo en ms; libxdo lo espera en µs
+        if _xdo.xdo_enter_text_window(_get_xdo(display), int(window_id), text.encode("utf-8"), delay_ms * 1000) != 0:
+            raise RuntimeError("Error enviando texto con libxdo.")
+        return
 
-        return True
+    try:
+        subprocess.check_call(
+            (XDOTOOL_EXE, "type", "--window", window_id, "--delay", str(delay_ms), text),
+            env=env
+        )
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Error enviando texto con xdotool: {e}")
+
+
+def perform_actions_linux(session_info, actions):
+    """
+    Ejecuta una secuencia de acciones sobre la sesión tomando el lock una sola
+    vez y resolviendo ventana y geometría una sola vez para todo el lote:
+      ("click", x_rel, y_rel) -> (x_abs, y_abs)
+      ("type", text[, delay_ms]) -> True
+      ("capture",)            -> io.BytesIO con JPEG
+    Retorna la lista de resultados en el mismo orden que las acciones.
+    """
+    with session_info["_lock"]:
+        display = session_info["display"]
+        env = session_info["_env"]
+        _check_chrome_alive(session_info)
+
+        window_id, (x, y, width, height) = _window_geometry(session_info)
+
+        resultados = []
+        for accion in actions:
+            tipo = accion[0]
+            if tipo == "click":
+                _, x_rel, y_rel = accion
+                if not (0 <= x_rel < width and 0 <= y_rel < height):
+                    raise ValueError(f"Coordenadas fuera de rango: ({x_rel}, {y_rel})")
+                _send_click(display, env, window_id, x_rel, y_rel)
+                resultados.append((x + x_rel, y + y_rel))
+            elif tipo == "type":
+                _send_text(display, env, window_id, *accion[1:])
+                resultados.append(True)
+            elif tipo == "capture":
+                jpeg = _grab_jpeg_turbo(session_info, x, y, width, height)
+                if jpeg is None:
+                    jpeg = _encode_jpeg(_grab_region(session_info, x, y, width, height),
+                                        session_info.get("low_latency", True))
+                resultados.append(jpeg)
+            else:
+                raise ValueError(f"Acción desconocida: {tipo}")
+        return resultados
 
 
 def stop_session_linux(session_info):
     """
-    Mata el proceso de Chrome y, si se arrancó Xvfb, también lo mata.
+    Mata el proceso de Chrome y, si se arrancó Xvfb, también lo mata
+    (junto con la conexión libxdo abierta contra ese DISPLAY).
+    Cada proceso recibe SIGTERM y, si no terminó en STOP_GRACE segundos,
+    SIGKILL; en ambos casos se recoge su estado para no dejar zombies.
     """
-    with lock:
+    with session_info["_lock"]:
         pid_chrome = session_info.get("pid_chrome")
         pid_xvfb = session_info.get("pid_xvfb")
 
+        # Solo cerramos la conexión si el DISPLAY es exclusivo de la sesión
+        if pid_xvfb and _xdo is not None:
+            _release_xdo(session_info["display"])
+
+        for clave in ("_framebuffer", "_capturer"):
+            recurso = session_info.pop(clave, None)
+            if recurso:
+                try:
+                    recurso.close()
+                except Exception:
+                    pass
+
+        # Chrome primero (todavía necesita su DISPLAY para cerrarse), luego Xvfb
         if pid_chrome:
+            pidfd = session_info.pop("_chrome_pidfd", None)
             try:
-                os.kill(pid_chrome, signal.SIGTERM)
-            except Exception:
-                pass
+                _terminate_child(pid_chrome, pidfd)
+            finally:
+                if pidfd is not None:
+                    os.close(pidfd)
 
         if pid_xvfb:
+            pidfd = session_info.pop("_xvfb_pidfd", None)
             try:
-                os.kill(pid_xvfb, signal.SIGTERM)
-            except Exception:
-                pass
+                _terminate_child(pid_xvfb, pidfd)
+            finally:
+                if pidfd is not None:
+                    os.close(pidfd)
+
+        # Perfil temporal de Chrome (ya no lo usa nadie)
+        profile_dir = session_info.pop("_profile_dir", None)
+        if profile_dir:
+            shutil.rmtree(profile_dir, ignore_errors=True)
@@ -2,13 +2,23 @@
 # -*- coding: utf-8 -*-
 
 import os
+import time
+import math
+import base64
+import hashlib
 import uuid
 import platform
+from collections import OrderedDict
 from datetime import datetime
 from threading import Lock
-from flask import Flask, jsonify, send_file, abort, request, render_template_string, make_response
+from flask import Flask, Response, jsonify, send_file, abort, request, stream_with_context, make_response
 import io
 
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None
+
 # Detectar sistema operativo
 SO = platform.system()  # "Linux", "Windows", etc.
 
@@ -21,18 +31,30 @@ else:
 
 app = Flask(__name__)
 
+# gzip/br solo para HTML y JSON (si está flask-compress); los JPEG ya van
+# comprimidos y recomprimirlos solo gastaría CPU
+if Compress is not None:
+    app.config["COMPRESS_MIMETYPES"] = ["text/html", "application/json"]
+    # Las respuestas en streaming (/actions) no se comprimen: flask-compress
+    # tendría que leerlas enteras y se perdería el envío progresivo
+    app.config["COMPRESS_STREAMS"] = False
+    Compress(app)
+
+# Sesiones Chrome precalentadas en Linux con Xvfb (0 para desactivar el pool;
+# con $DISPLAY no se precalienta)
+PREWARM_SESSIONS = int(os.environ.get("PREWARM_SESSIONS", "2"))
+
 # ------------------------------------------------
 #  Estructuras globales
 # ------------------------------------------------
 sessions = {}
 sessions_lock = Lock()
 
-actions_log = []
+# action_id -> entrada, en orden de llegada (acceso O(1) para actualizar o
+# quitar una acción); se descartan las más antiguas al pasar de MAX_ACTIONS
+actions_log = OrderedDict()
 actions_lock = Lock()
-
-# NOTA: Ya no necesitamos CAPTURES_DIR si no vamos a guardar PNG en disco
-# CAPTURES_DIR = os.path.join(os.getcwd(), "captures")
-# os.makedirs(CAPTURES_DIR, exist_ok=True)
+MAX_ACTIONS = 10000
 
 def log_action(action_type, session_id, details):
     action_id = str(uuid.uuid4())
@@ -45,27 +67,42 @@ def log_action(action_type, session_id, details):
         "details": details
     }
     with actions_lock:
-        actions_log.append(entry)
-    return action_id
+        actions_log[action_id] = entry
+        if len(actions_log) > MAX_ACTIONS:
+            actions_log.popitem(last=False)
+    # Se devuelve también la entrada para poder completar sus detalles sin buscarla
+    return action_id, entry
 
 # ------------------------------------------------
 #  ENDPOINT: /start_session  (POST)
 # ------------------------------------------------
 @app.route("/start_session", methods=["POST"])
 def start_session():
-    with sessions_lock:
-        try:
-            if SO == "Linux":
-                session_info = helpers.start_chrome_linux()
-            else:
-                session_info = helpers.start_chrome_windows()
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            return jsonify({"error": str(e)}), 500
+    # low_latency (por defecto true): JPEG de una sola pasada para el modo
+    # interactivo; false pide JPEG progresivo y optimizado (menos bytes)
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    if not isinstance(data, dict) or not isinstance(data.get("low_latency", True), bool):
+        return jsonify({"error": "JSON inválido. 'low_latency' debe ser true o false."}), 400
+    low_latency = data.get("low_latency", True)
+
+    # El arranque de Chrome puede tardar segundos: se hace fuera de
+    # sessions_lock, que solo protege el diccionario
+    try:
+        if SO == "Linux":
+            session_info = helpers.start_chrome_linux()
+        else:
+            session_info = helpers.start_chrome_windows()
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
 
+    session_info["low_latency"] = low_latency
+    with sessions_lock:
         sessions[session_info["session_id"]] = session_info
-        return jsonify({"session_id": session_info["session_id"]})
+    return jsonify({"session_id": session_info["session_id"]})
 
 # ------------------------------------------------
 #  ENDPOINT: /get_capture/<session_id>  (GET)
@@ -77,32 +114,41 @@ def get_capture(session_id):
         if not session_info:
             return abort(404)
 
+    # max_width (opcional): reduce capturas más anchas antes de codificar
+    max_width = request.args.get("max_width")
+    if max_width is not None:
+        try:
+            max_width = int(max_width)
+        except ValueError:
+            max_width = 0
+        if max_width <= 0:
+            return jsonify({"error": "'max_width' debe ser un entero > 0 (px)."}), 400
+
     # Registramos la acción (sin ruta de archivo, porque ya no guardamos en disco)
-    action_id = log_action("capture", session_id, {"note": "JPEG en memoria"})
+    action_id, entry = log_action("capture", session_id, {"note": "JPEG en memoria"})
 
     try:
         # Obtengo directamente un BytesIO con JPEG
         if SO == "Linux":
-            buf_jpeg = helpers.capture_window_linux(session_info)
+            buf_jpeg = helpers.capture_window_linux(session_info, max_width)
         else:
-            buf_jpeg = helpers.capture_window_windows(session_info)
+            buf_jpeg = helpers.capture_window_windows(session_info, max_width)
     except Exception as e:
         import traceback
         traceback.print_exc()
         # Quitamos el registro de la acción si falló
         with actions_lock:
-            actions_log[:] = [a for a in actions_log if a["action_id"] != action_id]
+            actions_log.pop(action_id, None)
         return jsonify({"error": str(e)}), 500
 
     # Actualizo los detalles del registro con, por ejemplo, el tamaño o algo si quieres:
     with actions_lock:
-        for act in actions_log:
-            if act["action_id"] == action_id:
-                act["details"] = {"note": "JPEG generado", "size_bytes": buf_jpeg.getbuffer().nbytes}
-                break
+        entry["details"] = {"note": "JPEG generado", "size_bytes": buf_jpeg.getbuffer().nbytes}
 
     # Envío el JPEG en memoria con headers anti-caché:
-    response = make_response(send_file(buf_jpeg, mimetype="image/jpeg"))
+    response = make_response(
+        send_file(buf_jpeg, mimetype="image/jpeg", download_name=f"{action_id}.jpg")
+    )
     response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
     response.headers["Pragma"] = "no-cache"
     response.headers["Expires"] = "0"
@@ -130,7 +176,7 @@ def click_window(session_id):
             x_abs, y_abs = helpers.click_window_linux(session_info, x_rel, y_rel)
         else:
             x_abs, y_abs = helpers.click_window_windows(session_info, x_rel, y_rel)
-        action_id = log_action("click", session_id, {
+        action_id, _ = log_action("click", session_id, {
             "x_rel": x_rel, "y_rel": y_rel, "x_abs": x_abs, "y_abs": y_abs
         })
     except Exception as e:
@@ -150,6 +196,13 @@ def type_text(session_id):
         return jsonify({"error": "JSON inválido. Se requiere 'text'."}), 400
 
     text = data["text"]
+    # Retardo opcional entre teclas en ms (0 = sin retardo)
+    try:
+        delay_ms = int(data.get("delay", 0))
+    except (TypeError, ValueError):
+        delay_ms = -1
+    if delay_ms < 0:
+        return jsonify({"error": "'delay' debe ser un entero >= 0 (ms)."}), 400
 
     with sessions_lock:
         session_info = sessions.get(session_id)
@@ -158,10 +211,10 @@ def type_text(session_id):
 
     try:
         if SO == "Linux":
-            helpers.type_text_linux(session_info, text)
+            helpers.type_text_linux(session_info, text, delay_ms)
         else:
-            helpers.type_text_windows(session_info, text)
-        action_id = log_action("type", session_id, {"text": text})
+            helpers.type_text_windows(session_info, text, delay_ms)
+        action_id, _ = log_action("type", session_id, {"text": text, "delay": delay_ms})
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -169,13 +222,134 @@ def type_text(session_id):
 
     return jsonify({"action_id": action_id, "status": "ok"})
 
+# ------------------------------------------------
+#  ENDPOINT: /perform/<session_id>  (POST)
+#  Lote de acciones en una sola llamada (solo Linux):
+#  {"actions": [{"type": "click", "x": 10, "y": 20},
+#               {"type": "type", "text": "hola", "delay": 0},
+#               {"type": "capture"}]}
+# ------------------------------------------------
+@app.route("/perform/<session_id>", methods=["POST"])
+def perform_actions(session_id):
+    if SO != "Linux":
+        return jsonify({"error": "El lote de acciones solo está disponible en Linux."}), 501
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("actions"), list):
+        return jsonify({"error": "JSON inválido. Se requiere 'actions' (lista)."}), 400
+
+    actions = []
+    try:
+        for act in data["actions"]:
+            if act["type"] == "click":
+                actions.append(("click", int(act["x"]), int(act["y"])))
+            elif act["type"] == "type":
+                delay_ms = int(act.get("delay", 0))
+                if delay_ms < 0:
+                    raise ValueError(delay_ms)
+                actions.append(("type", str(act["text"]), delay_ms))
+            elif act["type"] == "capture":
+                actions.append(("capture",))
+            else:
+                raise ValueError(act["type"])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "Acción inválida. Tipos: 'click' (x, y), 'type' (text[, delay]), 'capture'."}), 400
+
+    with sessions_lock:
+        session_info = sessions.get(session_id)
+        if not session_info:
+            return abort(404)
+
+    try:
+        results = helpers.perform_actions_linux(session_info, actions)
+        action_id, _ = log_action("perform", session_id, {
+            "actions": data["actions"]
+        })
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+    salida = []
+    for act, res in zip(actions, results):
+        if act[0] == "click":
+            salida.append({"x_abs": res[0], "y_abs": res[1]})
+        elif act[0] == "type":
+            salida.append({"status": "ok"})
+        else:
+            salida.append({"jpeg_base64": base64.b64encode(res.getvalue()).decode("ascii")})
+
+    return jsonify({"action_id": action_id, "status": "ok", "results": salida})
+
+# ------------------------------------------------
+#  ENDPOINT: /stream/<session_id>?fps=N  (GET)
+#  Flujo MJPEG (multipart/x-mixed-replace): con <img src="/stream/...">
+#  el navegador muestra cada captura nueva sin pedirlas una a una.
+#  /get_capture sigue disponible para capturas sueltas.
+# ------------------------------------------------
+STREAM_MAX_FPS = 15
+
+@app.route("/stream/<session_id>", methods=["GET"])
+def stream_capture(session_id):
+    with sessions_lock:
+        session_info = sessions.get(session_id)
+        if not session_info:
+            return abort(404)
+
+    try:
+        fps = float(request.args.get("fps", 5))
+    except ValueError:
+        fps = math.nan
+    if not math.isfinite(fps):
+        return jsonify({"error": "'fps' debe ser numérico."}), 400
+    intervalo = 1.0 / min(max(fps, 0.1), STREAM_MAX_FPS)
+
+    if SO == "Linux":
+        capturar = helpers.capture_window_linux
+    else:
+        capturar = helpers.capture_window_windows
+
+    log_action("stream", session_id, {"fps": round(1.0 / intervalo, 2)})
+
+    def frames():
+        siguiente = time.monotonic()
+        while True:
+            # Termina cuando se para la sesión (o el cliente cierra la conexión)
+            with sessions_lock:
+                if sessions.get(session_id) is not session_info:
+                    return
+            try:
+                jpeg = capturar(session_info).getvalue()
+            except Exception:
+                import traceback
+                traceback.print_exc()
+                return
+            yield (b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: "
+                   + str(len(jpeg)).encode() + b"\r\n\r\n")
+            yield jpeg
+            yield b"\r\n"
+
+            siguiente += intervalo
+            espera = siguiente - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            else:
+                # Capturar tardó más que el intervalo: no acumular retraso
+                siguiente = time.monotonic()
+
+    response = Response(frames(), mimetype="multipart/x-mixed-replace; boundary=frame")
+    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+    return response
+
 # ------------------------------------------------
 #  ENDPOINT: /stop_session/<session_id>  (POST|GET)
 # ------------------------------------------------
 @app.route("/stop_session/<session_id>", methods=["POST", "GET"])
 def stop_session(session_id):
+    # Se saca del diccionario antes de pararla: dos /stop_session simultáneos
+    # no deben matar los mismos procesos dos veces
     with sessions_lock:
-        session_info = sessions.get(session_id)
+        session_info = sessions.pop(session_id, None)
         if not session_info:
             return abort(404)
 
@@ -187,69 +361,94 @@ def stop_session(session_id):
     except Exception:
         pass
 
-    with sessions_lock:
-        sessions.pop(session_id, None)
-
     return jsonify({"stopped": True})
 
 # ------------------------------------------------
 #  ENDPOINT: /actions  (GET)
 # ------------------------------------------------
+ACTIONS_HTML = """
+<!DOCTYPE html>
+<html lang="es">
+<head>
+  <meta charset="UTF-8">
+  <title>Listado de Acciones</title>
+  <style>
+    body { font-family: sans-serif; margin: 20px; }
+    table { border-collapse: collapse; width: 100%; }
+    th, td { border: 1px solid #666; padding: 8px; text-align: left; }
+    th { background: #eee; }
+    pre { white-space: pre-wrap; word-break: break-all; }
+  </style>
+</head>
+<body>
+  <h1>Registro de Acciones</h1>
+  <table>
+    <thead>
+      <tr>
+        <th>Action ID</th>
+        <th>Timestamp (UTC)</th>
+        <th>Tipo</th>
+        <th>Session ID</th>
+        <th>Detalles</th>
+      </tr>
+    </thead>
+    <tbody>
+      {% for act in actions %}
+      <tr>
+        <td>{{ act["action_id"] }}</td>
+        <td>{{ act["timestamp"] }}</td>
+        <td>{{ act["type"] }}</td>
+        <td>{{ act["session_id"] }}</td>
+        <td><pre>{{ act["details"] }}</pre></td>
+      </tr>
+      {% endfor %}
+    </tbody>
+  </table>
+</body>
+</html>
+"""
+
+# Compilada una sola vez (autoescape activo, como en render_template_string)
+_ACTIONS_TMPL = app.jinja_env.from_string(ACTIONS_HTML)
+
 @app.route("/actions", methods=["GET"])
 def view_actions():
+    # Copia de las entradas bajo el lock; el HTML se genera y se envía por
+    # partes fuera de él, sin bloquear a log_action mientras tanto
     with actions_lock:
-        html = """
-        <!DOCTYPE html>
-        <html lang="es">
-        <head>
-          <meta charset="UTF-8">
-          <title>Listado de Acciones</title>
-          <style>
-            body { font-family: sans-serif; margin: 20px; }
-            table { border-collapse: collapse; width: 100%; }
-            th, td { border: 1px solid #666; padding: 8px; text-align: left; }
-            th { background: #eee; }
-            pre { white-space: pre-wrap; word-break: break-all; }
-          </style>
-        </head>
-        <body>
-          <h1>Registro de Acciones</h1>
-          <table>
-            <thead>
-              <tr>
-                <th>Action ID</th>
-                <th>Timestamp (UTC)</th>
-                <th>Tipo</th>
-                <th>Session ID</th>
-                <th>Detalles</th>
-              </tr>
-            </thead>
-            <tbody>
-              {% for act in actions %}
-              <tr>
-                <td>{{ act["action_id"] }}</td>
-                <td>{{ act["timestamp"] }}</td>
-                <td>{{ act["type"] }}</td>
-                <td>{{ act["session_id"] }}</td>
-                <td><pre>{{ act["details"] }}</pre></td>
-              </tr>
-              {% endfor %}
-            </tbody>
-          </table>
-        </body>
-        </html>
-        """
-        return render_template_string(html, actions=actions_log)
+        snapshot = list(actions_log.values())
+    return Response(stream_with_context(_ACTIONS_TMPL.generate(actions=snapshot)), mimetype="text/html")
 
 # ------------------------------------------------
 #  ENDPOINT: servir index.html (cliente web)
 # ------------------------------------------------
+# El cliente no cambia durante la vida del proceso: se lee una vez y se
+# sirve desde memoria con un ETag fijo (304 si el navegador ya lo tiene)
+with open(os.path.join(app.root_path, "index.html"), "rb") as f:
+    _INDEX_BYTES = f.read()
+_INDEX_ETAG = hashlib.md5(_INDEX_BYTES).hexdigest()
+
 @app.route("/")
 def home():
-    return send_file("index.html")
+    # flask-compress entrega el ETag como "<md5>:gzip" (o ":br"): el
+    # navegador revalida con ese, así que se compara sin el sufijo
+    for tag in request.if_none_match.as_set():
+        if tag.split(":", 1)[0] == _INDEX_ETAG:
+            response = Response(status=304)
+            response.set_etag(tag)
+            response.headers["Cache-Control"] = "public, max-age=60"
+            return response
+
+    response = Response(_INDEX_BYTES, mimetype="text/html")
+    response.set_etag(_INDEX_ETAG)
+    response.headers["Cache-Control"] = "public, max-age=60"
+    return response.make_conditional(request)
 
 # ------------------------------------------------
-#  MAIN: arranque de Flask
+#  MAIN: arranque de Flask (servidor de desarrollo; en producción
+#  usar `gunicorn remote:app`, configurado en gunicorn.conf.py)
 # ------------------------------------------------
 if __name__ == "__main__":
+    if SO == "Linux":
+        helpers.prewarm(PREWARM_SESSIONS)
     app.run(host="0.0.0.0", port=5000, debug=False)
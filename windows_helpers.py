@@ -9,16 +9,179 @@ import time
 import signal
 import uuid
 import subprocess
-from threading import Lock
+from threading import Lock, Thread
 from PIL import ImageGrab, Image
 import io
+import ctypes
+from ctypes import wintypes
 
 import win32gui
 import win32process
 import win32api
 import win32con
-
+import win32event
+
+try:
+    import mss
+except ImportError:
+    mss = None
+
+# libjpeg-turbo (PyTurboJPEG) codifica el BGRA de mss en una sola llamada,
+# sin pasar por PIL; si no está, se usa el codificador de PIL.
+try:
+    import numpy
+    from turbojpeg import TurboJPEG, TJPF_BGRX, TJSAMP_420, TJFLAG_PROGRESSIVE
+    _tj = TurboJPEG()
+except Exception:
+    _tj = None
+
+# Solo serializa el arranque de Chrome; cada sesión tiene su propio lock en
+# session_info["_lock"]. El ratón y el foco del teclado son globales del
+# escritorio: la inyección de eventos se serializa aparte con _input_lock.
 lock = Lock()
+_input_lock = Lock()
+
+# Tiempo (s) durante el cual se reutiliza el rect de la ventana sin volver a pedirlo
+RECT_TTL = 0.2
+
+# Ruta de Chrome, resuelta una sola vez al importar el módulo
+CHROME_EXE = r"C:\Program Files\Google\Chrome\Application\chrome.exe"
+if not os.path.exists(CHROME_EXE):
+    CHROME_EXE = "chrome"
+
+
+# ------------------------------------------------
+#  SendInput (ctypes): varios eventos de teclado/ratón en una sola llamada
+# ------------------------------------------------
+INPUT_MOUSE = 0
+INPUT_KEYBOARD = 1
+KEYEVENTF_KEYUP = 0x0002
+KEYEVENTF_UNICODE = 0x0004
+MOUSEEVENTF_MOVE = 0x0001
+MOUSEEVENTF_LEFTDOWN = 0x0002
+MOUSEEVENTF_LEFTUP = 0x0004
+MOUSEEVENTF_VIRTUALDESK = 0x4000
+MOUSEEVENTF_ABSOLUTE = 0x8000
+
+
+class _MOUSEINPUT(ctypes.Structure):
+    _fields_ = [("dx", wintypes.LONG), ("dy", wintypes.LONG),
+                ("mouseData", wintypes.DWORD), ("dwFlags", wintypes.DWORD),
+                ("time", wintypes.DWORD), ("dwExtraInfo", ctypes.c_size_t)]
+
+
+class _KEYBDINPUT(ctypes.Structure):
+    _fields_ = [("wVk", wintypes.WORD), ("wScan", wintypes.WORD),
+                ("dwFlags", wintypes.DWORD), ("time", wintypes.DWORD),
+                ("dwExtraInfo", ctypes.c_size_t)]
+
+
+class _INPUT(ctypes.Structure):
+    # El union debe incluir MOUSEINPUT (el miembro más grande) para que
+    # sizeof(INPUT) coincida con el que espera user32
+    class _U(ctypes.Union):
+        _fields_ = [("mi", _MOUSEINPUT), ("ki", _KEYBDINPUT)]
+    _anonymous_ = ("u",)
+    _fields_ = [("type", wintypes.DWORD), ("u", _U)]
+
+
+_user32 = ctypes.WinDLL("user32", use_last_error=True)
+_user32.SendInput.argtypes = [wintypes.UINT, ctypes.POINTER(_INPUT), ctypes.c_int]
+_user32.SendInput.restype = wintypes.UINT
+
+# PrintWindow / GDI (ctypes): copia de la ventana a un bitmap fuera de pantalla
+PW_RENDERFULLCONTENT = 0x00000002
+DIB_RGB_COLORS = 0
+BI_RGB = 0
+
+
+class _BITMAPINFOHEADER(ctypes.Structure):
+    _fields_ = [("biSize", wintypes.DWORD), ("biWidth", wintypes.LONG),
+                ("biHeight", wintypes.LONG), ("biPlanes", wintypes.WORD),
+                ("biBitCount", wintypes.WORD), ("biCompression", wintypes.DWORD),
+                ("biSizeImage", wintypes.DWORD), ("biXPelsPerMeter", wintypes.LONG),
+                ("biYPelsPerMeter", wintypes.LONG), ("biClrUsed", wintypes.DWORD),
+                ("biClrImportant", wintypes.DWORD)]
+
+
+_user32.PrintWindow.argtypes = [wintypes.HWND, wintypes.HDC, wintypes.UINT]
+_user32.PrintWindow.restype = wintypes.BOOL
+_user32.GetDC.argtypes = [wintypes.HWND]
+_user32.GetDC.restype = wintypes.HDC
+_user32.ReleaseDC.argtypes = [wintypes.HWND, wintypes.HDC]
+
+_gdi32 = ctypes.WinDLL("gdi32", use_last_error=True)
+_gdi32.CreateCompatibleDC.argtypes = [wintypes.HDC]
+_gdi32.CreateCompatibleDC.restype = wintypes.HDC
+_gdi32.CreateCompatibleBitmap.argtypes = [wintypes.HDC, ctypes.c_int, ctypes.c_int]
+_gdi32.CreateCompatibleBitmap.restype = wintypes.HBITMAP
+_gdi32.SelectObject.argtypes = [wintypes.HDC, wintypes.HGDIOBJ]
+_gdi32.SelectObject.restype = wintypes.HGDIOBJ
+_gdi32.DeleteObject.argtypes = [wintypes.HGDIOBJ]
+_gdi32.DeleteDC.argtypes = [wintypes.HDC]
+_gdi32.GetDIBits.argtypes = [wintypes.HDC, wintypes.HBITMAP, wintypes.UINT, wintypes.UINT,
+                             ctypes.c_void_p, ctypes.POINTER(_BITMAPINFOHEADER), wintypes.UINT]
+_gdi32.GetDIBits.restype = ctypes.c_int
+
+# Caracteres de control que Chrome solo entiende como tecla virtual (como
+# Unicode llegarían como WM_CHAR sin pulsar la tecla)
+_CONTROL_VKS = {"\n": win32con.VK_RETURN, "\r": win32con.VK_RETURN, "\t": win32con.VK_TAB}
+
+
+def _send_inputs(inputs):
+    """
+    Inyecta la lista de _INPUT con una única llamada a SendInput.
+    """
+    if not inputs:
+        return
+    arr = (_INPUT * len(inputs))(*inputs)
+    if _user32.SendInput(len(inputs), arr, ctypes.sizeof(_INPUT)) != len(inputs):
+        raise RuntimeError(f"SendInput falló (error {ctypes.get_last_error()}).")
+
+
+def _key(vk=0, scan=0, flags=0):
+    return _INPUT(type=INPUT_KEYBOARD, ki=_KEYBDINPUT(wVk=vk, wScan=scan, dwFlags=flags))
+
+
+def _click_inputs(x_abs, y_abs):
+    """
+    Movimiento absoluto a (x_abs, y_abs) + botón izquierdo abajo/arriba, para
+    enviarlos en un único SendInput. Las coordenadas absolutas de SendInput
+    van normalizadas a 0..65535 sobre el escritorio virtual (todos los monitores).
+    """
+    vx = win32api.GetSystemMetrics(win32con.SM_XVIRTUALSCREEN)
+    vy = win32api.GetSystemMetrics(win32con.SM_YVIRTUALSCREEN)
+    vw = win32api.GetSystemMetrics(win32con.SM_CXVIRTUALSCREEN)
+    vh = win32api.GetSystemMetrics(win32con.SM_CYVIRTUALSCREEN)
+    dx = ((x_abs - vx) * 65535) // max(vw - 1, 1)
+    dy = ((y_abs - vy) * 65535) // max(vh - 1, 1)
+    flags = MOUSEEVENTF_ABSOLUTE | MOUSEEVENTF_VIRTUALDESK
+    return [
+        _INPUT(type=INPUT_MOUSE, mi=_MOUSEINPUT(dx=dx, dy=dy, dwFlags=flags | MOUSEEVENTF_MOVE)),
+        _INPUT(type=INPUT_MOUSE, mi=_MOUSEINPUT(dx=dx, dy=dy, dwFlags=flags | MOUSEEVENTF_LEFTDOWN)),
+        _INPUT(type=INPUT_MOUSE, mi=_MOUSEINPUT(dx=dx, dy=dy, dwFlags=flags | MOUSEEVENTF_LEFTUP)),
+    ]
+
+
+def _text_inputs(text):
+    """
+    Secuencia de eventos para escribir text: cada unidad UTF-16 va como
+    KEYEVENTF_UNICODE (abajo/arriba), sin traducir a tecla virtual, así que
+    no depende del layout del teclado (dos eventos por carácter fuera del
+    BMP). Solo salto de línea y tabulador se envían como VK_RETURN/VK_TAB.
+    """
+    inputs = []
+    data = text.encode("utf-16-le")
+    for i in range(0, len(data), 2):
+        scan = data[i] | (data[i + 1] << 8)
+        vk = _CONTROL_VKS.get(chr(scan))
+        if vk is not None:
+            inputs.append(_key(vk=vk))
+            inputs.append(_key(vk=vk, flags=KEYEVENTF_KEYUP))
+            continue
+        inputs.append(_key(scan=scan, flags=KEYEVENTF_UNICODE))
+        inputs.append(_key(scan=scan, flags=KEYEVENTF_UNICODE | KEYEVENTF_KEYUP))
+    return inputs
 
 
 # ------------------------------------------------
@@ -27,7 +190,8 @@ lock = Lock()
 def start_chrome_windows():
     """
     1) Lanza Chrome en modo maximizado (--start-maximized).
-    2) Espera, localiza con EnumWindows el HWND cuyo PID coincida.
+    2) Localiza con EnumWindows el HWND cuyo PID coincida, reintentando
+       con espera creciente hasta que aparezca (sin espera fija).
     3) Obtiene región completa de la ventana (incluye bordes/decoration).
     Devuelve dict con:
       {
@@ -38,15 +202,13 @@ def start_chrome_windows():
       }
     """
     with lock:
-        chrome_path = r"C:\Program Files\Google\Chrome\Application\chrome.exe"
-        if not os.path.exists(chrome_path):
-            chrome_path = "chrome"
-
+        # Un único uuid para el perfil temporal y el session_id
+        sid = uuid.uuid4()
         cmd = [
-            chrome_path,
+            CHROME_EXE,
             "--new-window",
             "--start-maximized",
-            f"--user-data-dir=C:\\Temp\\remote-profile-{uuid.uuid4()}",
+            f"--user-data-dir=C:\\Temp\\remote-profile-{sid}",
             "about:blank"
         ]
         try:
@@ -55,10 +217,8 @@ def start_chrome_windows():
             raise RuntimeError(f"No se pudo lanzar Chrome en Windows: {e}")
 
         pid_chrome = proc.pid
-        # Esperamos a que la ventana aparezca y se maximice
-        time.sleep(2.5)
-
-        hwnd = _find_chrome_window_windows(pid_chrome)
+        # Buscar la ventana con espera creciente hasta que aparezca (máx. 8 s)
+        hwnd = _wait_for_chrome_window(pid_chrome, proc)
         if hwnd is None:
             try:
                 os.kill(pid_chrome, signal.SIGTERM)
@@ -66,38 +226,154 @@ def start_chrome_windows():
                 pass
             raise RuntimeError("No se encontró la ventana de Chrome en Windows.")
 
-        rect = _get_window_rect_windows(hwnd)
-        session_id = str(uuid.uuid4())
-        return {
+        session_id = str(sid)
+        session_info = {
             "session_id": session_id,
             "pid_chrome": pid_chrome,
+            "_proc_h": _open_process(pid_chrome),
+            "_lock": Lock(),
             "hwnd": hwnd,
-            "window_rect": rect  # (left, top, right, bottom)
         }
+        _store_rect(session_info, _get_window_rect_windows(hwnd))
+        if session_info["_proc_h"] is not None:
+            watcher = Thread(target=_watch_process, args=(session_info,),
+                             name=f"chrome-watch-{pid_chrome}", daemon=True)
+            session_info["_watcher"] = watcher
+            watcher.start()
+        return session_info
+
+
+def _wait_for_chrome_window(pid_chrome, proc, timeout=8.0):
+    """
+    Busca la ventana de Chrome empezando cada 50 ms y espaciando los intentos
+    (x1.5, máx. 250 ms). Retorna el HWND en cuanto existe, o None si pasan
+    `timeout` segundos o Chrome termina antes de mostrar su ventana.
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    while True:
+        hwnd = _find_chrome_window_windows(pid_chrome)
+        if hwnd is not None or time.monotonic() >= deadline or proc.poll() is not None:
+            return hwnd
+        time.sleep(delay)
+        delay = min(delay * 1.5, 0.25)
+
+
+class _Found(Exception):
+    """Corta EnumWindows en cuanto aparece la ventana buscada."""
 
 
 def _find_chrome_window_windows(pid_chrome):
     """
-    Recorre con EnumWindows todas las ventanas visibles y devuelve el primer HWND
-    cuyo PID coincide con pid_chrome y cuyo título contenga "Chrome".
+    Recorre con EnumWindows las ventanas de nivel superior y devuelve el primer HWND
+    visible cuyo PID coincide con pid_chrome y cuyo título contenga "Chrome".
+
+    1. El filtro por PID va primero: descarta casi todas las ventanas sin
+       construir el título.
+    2. GetWindowText solo se llama para las ventanas de Chrome.
+    3. Al encontrarla, el callback lanza _Found y EnumWindows se detiene
+       (pywin32 propaga la excepción del callback).
     """
+    # Funciones en variables locales: el callback se ejecuta una vez por ventana
+    get_pid = win32process.GetWindowThreadProcessId
+    is_visible = win32gui.IsWindowVisible
+    get_text = win32gui.GetWindowText
     result = []
 
     def enum_callback(hwnd, extra):
-        if not win32gui.IsWindowVisible(hwnd):
+        if get_pid(hwnd)[1] != pid_chrome:
             return True
-        _, pid = win32process.GetWindowThreadProcessId(hwnd)
-        if pid != pid_chrome:
+        if not is_visible(hwnd):
             return True
-        title = win32gui.GetWindowText(hwnd) or ""
-        if "Chrome" in title:
+        if "Chrome" in get_text(hwnd):
             result.append(hwnd)
+            raise _Found
         return True
 
-    win32gui.EnumWindows(enum_callback, None)
+    try:
+        win32gui.EnumWindows(enum_callback, None)
+    except _Found:
+        pass
     return result[0] if result else None
 
 
+def _open_process(pid):
+    """
+    Handle del proceso (espera + terminación), abierto una vez por sesión.
+    None si no se pudo abrir.
+    """
+    try:
+        return win32api.OpenProcess(
+            win32con.SYNCHRONIZE | win32con.PROCESS_TERMINATE, False, pid
+        )
+    except Exception:
+        return None
+
+
+def _watch_process(session_info):
+    """
+    Hilo por sesión: espera (sin sondeo) a que termine el proceso de Chrome
+    y marca session_info["_dead"].
+    """
+    win32event.WaitForSingleObject(session_info["_proc_h"], win32event.INFINITE)
+    session_info["_dead"] = True
+
+
+def _check_chrome_alive(session_info):
+    """
+    Lanza RuntimeError si Chrome ya terminó: solo lee la marca que pone
+    _watch_process, sin llamadas al sistema.
+    Sin handle (ni hilo), la validación del HWND detectará si Chrome murió.
+    """
+    if session_info.get("_dead"):
+        raise RuntimeError("El proceso de Chrome ya no existe en Windows.")
+
+
+def _hwnd_valid(hwnd, pid):
+    """
+    True si hwnd sigue siendo una ventana y pertenece al proceso pid
+    (dos llamadas baratas en lugar de recorrer todas las ventanas).
+    """
+    return bool(hwnd) and win32gui.IsWindow(hwnd) and \
+        win32process.GetWindowThreadProcessId(hwnd)[1] == pid
+
+
+def _store_rect(session_info, rect):
+    """
+    Guarda el rect (left, top, right, bottom) en la sesión: la tupla en
+    "window_rect" (compatibilidad) y además _l, _t, _w, _h como enteros
+    sueltos, que es lo que usan clic y captura.
+    """
+    left, top, right, bottom = rect
+    session_info["window_rect"] = rect
+    session_info["_l"] = left
+    session_info["_t"] = top
+    session_info["_w"] = right - left
+    session_info["_h"] = bottom - top
+    session_info["_rect_at"] = time.monotonic()
+
+
+def _window_rect(session_info):
+    """
+    Devuelve el HWND de la ventana de Chrome y deja al día _l, _t, _w, _h.
+    El HWND guardado se reutiliza mientras siga siendo válido (si no, se
+    vuelve a buscar con EnumWindows) y el rect se reutiliza durante RECT_TTL.
+    """
+    pid = session_info["pid_chrome"]
+    hwnd = session_info.get("hwnd")
+    if not _hwnd_valid(hwnd, pid):
+        hwnd = _find_chrome_window_windows(pid)
+        if hwnd is None:
+            raise RuntimeError("No se encontró la ventana de Chrome en Windows.")
+        session_info["hwnd"] = hwnd
+        session_info.pop("_rect_at", None)
+
+    cached_at = session_info.get("_rect_at")
+    if cached_at is None or time.monotonic() - cached_at >= RECT_TTL:
+        _store_rect(session_info, _get_window_rect_windows(hwnd))
+    return hwnd
+
+
 def _get_window_rect_windows(hwnd):
     """
     Dado un HWND, obtiene la región completa de la ventana (incluye barra de título y bordes)
@@ -110,43 +386,153 @@ def _get_window_rect_windows(hwnd):
 # ------------------------------------------------
 #  2. Capturar la ventana completa (ahora JPEG en memoria)
 # ------------------------------------------------
-def capture_window_windows(session_info, out_path=None):
+def _get_sct(session_info):
     """
-    Usa PIL.ImageGrab.grab(bbox) para capturar la región completa de la ventana
-    (obtiene coords con GetWindowRect). EN LUGAR DE GUARDAR PNG, convierte a JPEG en un
-    io.BytesIO y retorna ese buffer. El parámetro opcional 'out_path' se IGNORA.
-    Devuelve el io.BytesIO con JPEG (posición al inicio).
+    Devuelve la instancia mss de la sesión, creándola la primera vez
+    (reutiliza sus DC y su DIB entre capturas). None si mss no está instalado.
     """
-    with lock:
-        hwnd = session_info["hwnd"]
-        pid = session_info["pid_chrome"]
+    sct = session_info.get("_sct")
+    if sct is None:
+        sct = False
+        if mss is not None:
+            try:
+                sct = mss.mss()
+            except Exception:
+                sct = False
+        session_info["_sct"] = sct
+    return sct or None
 
-        # Verificar que el proceso siga vivo
-        try:
-            os.kill(pid, 0)
-        except OSError:
-            raise RuntimeError("El proceso de Chrome ya no existe en Windows.")
 
-        # Reubicar HWND por si cambió
-        new_hwnd = _find_chrome_window_windows(pid)
-        if new_hwnd is None:
-            raise RuntimeError("No se encontró el HWND de Chrome al recapturar en Windows.")
-        session_info["hwnd"] = new_hwnd
+def _get_frame(session_info, size):
+    """
+    Imagen RGB de la sesión donde se vuelcan las capturas (PrintWindow o mss): se crea la
+    primera vez y solo se vuelve a crear si cambia el tamaño de la ventana.
+    Debe usarse con el lock de la sesión tomado.
+    """
+    frame = session_info.get("_frame")
+    if frame is None or frame.size != size:
+        frame = session_info["_frame"] = Image.new("RGB", size)
+    return frame
+
+
+def _print_window(session_info, hwnd, width, height):
+    """
+    Copia la ventana con PrintWindow(PW_RENDERFULLCONTENT) al bitmap fuera de
+    pantalla de la sesión, aunque esté tapada por otras ventanas, y devuelve
+    sus píxeles BGRX (filas de arriba abajo) en el buffer de la sesión.
+    El DC, el bitmap y el buffer se crean la primera vez y solo se vuelven a
+    crear si cambia el tamaño. None si PrintWindow o GetDIBits fallan.
+    Debe llamarse con el lock de la sesión tomado.
+    """
+    pw = session_info.get("_pw")
+    if pw is None or pw[0] != (width, height):
+        _release_print_window(session_info)
+        screen_dc = _user32.GetDC(None)
+        try:
+            mem_dc = _gdi32.CreateCompatibleDC(screen_dc)
+            bmp = _gdi32.CreateCompatibleBitmap(screen_dc, width, height)
+        finally:
+            _user32.ReleaseDC(None, screen_dc)
+        _gdi32.SelectObject(mem_dc, bmp)
+        # biHeight negativo: filas de arriba abajo, como espera PIL/TurboJPEG
+        header = _BITMAPINFOHEADER(biSize=ctypes.sizeof(_BITMAPINFOHEADER), biWidth=width,
+                                   biHeight=-height, biPlanes=1, biBitCount=32,
+                                   biCompression=BI_RGB)
+        pw = session_info["_pw"] = ((width, height), mem_dc, bmp, header,
+                                    ctypes.create_string_buffer(width * height * 4))
+
+    _, mem_dc, bmp, header, pixels = pw
+    if not _user32.PrintWindow(hwnd, mem_dc, PW_RENDERFULLCONTENT):
+        return None
+    if _gdi32.GetDIBits(mem_dc, bmp, 0, height, pixels, ctypes.byref(header), DIB_RGB_COLORS) != height:
+        return None
+    return pixels
+
+
+def _release_print_window(session_info):
+    """
+    Libera el DC y el bitmap de PrintWindow de la sesión, si existen.
+    """
+    pw = session_info.pop("_pw", None)
+    if pw is not None:
+        _gdi32.DeleteDC(pw[1])
+        _gdi32.DeleteObject(pw[2])
 
-        # Obtener el rect completo (left, top, right, bottom)
-        left, top, right, bottom = _get_window_rect_windows(new_hwnd)
-        rect = (left, top, right, bottom)
-        session_info["window_rect"] = rect
 
-        # Capturamos la región con PIL.ImageGrab
-        img = ImageGrab.grab(bbox=rect)
+def capture_window_windows(session_info, max_width=None):
+    """
+    Captura la ventana completa (tamaño de GetWindowRect) con PrintWindow,
+    que funciona aunque esté tapada; si falla, la región de pantalla con
+    mss si está disponible, o con PIL.ImageGrab.grab(bbox). EN LUGAR DE
+    GUARDAR PNG, convierte a JPEG en un io.BytesIO (con libjpeg-turbo si
+    está disponible, si no con PIL) y retorna ese buffer.
+    Si se indica max_width y la ventana es más ancha, la imagen se reduce
+    (bilineal, manteniendo proporción) antes de codificarla.
+    Devuelve el io.BytesIO con JPEG (posición al inicio).
+    """
+    with session_info["_lock"]:
+        # Verificar que el proceso siga vivo
+        _check_chrome_alive(session_info)
+
+        # HWND (revalidado) y rect completo, cacheado en _l, _t, _w, _h
+        hwnd = _window_rect(session_info)
+        left, top = session_info["_l"], session_info["_t"]
+        width, height = session_info["_w"], session_info["_h"]
+
+        # Píxeles BGRX de la ventana: PrintWindow y, si falla, la región de
+        # pantalla con mss; sin ninguno de los dos, PIL.ImageGrab
+        bgrx = _print_window(session_info, hwnd, width, height)
+        if bgrx is None:
+            sct = _get_sct(session_info)
+            if sct is not None:
+                raw = sct.grab({"left": left, "top": top, "width": width, "height": height})
+                bgrx, width, height = raw.raw, raw.width, raw.height
+
+        if bgrx is not None:
+            if _tj is not None and not (max_width and width > max_width):
+                # BGRX -> JPEG directamente con libjpeg-turbo
+                pixels = numpy.frombuffer(bgrx, numpy.uint8).reshape(height, width, 4)
+                # En modo progresivo libjpeg-turbo ya optimiza las tablas Huffman
+                flags = 0 if session_info.get("low_latency", True) else TJFLAG_PROGRESSIVE
+                return io.BytesIO(
+                    _tj.encode(pixels, quality=75, pixel_format=TJPF_BGRX,
+                               jpeg_subsample=TJSAMP_420, flags=flags)
+                )
+            # BGRA -> RGB sobre la imagen de la sesión (sin reservar otra);
+            # se codifica aquí porque la siguiente captura la sobrescribe
+            img = _get_frame(session_info, (width, height))
+            img.frombytes(bgrx, "raw", "BGRX")
+            return _encode_jpeg(_scale(img, max_width), session_info.get("low_latency", True))
+
+        img = ImageGrab.grab(bbox=(left, top, left + width, top + height))
+
+    # Reducir y convertir la imagen a JPEG en memoria (fuera del lock: ImageGrab
+    # devuelve una imagen nueva)
+    return _encode_jpeg(_scale(img, max_width), session_info.get("low_latency", True))
+
+
+def _scale(img, max_width):
+    """
+    Reduce img (bilineal, manteniendo proporción) si es más ancha que max_width.
+    """
+    if max_width and img.width > max_width:
+        img = img.resize((max_width, max(1, img.height * max_width // img.width)), Image.BILINEAR)
+    return img
 
-        # Convertir la imagen a JPEG en memoria
-        buf = io.BytesIO()
-        img.save(buf, format="JPEG", quality=75)
-        buf.seek(0)
 
-        return buf
+def _encode_jpeg(img, low_latency=True):
+    """
+    Codifica la captura como JPEG (calidad 75, 4:2:0) en un io.BytesIO
+    posicionado al inicio.
+    low_latency=True: una sola pasada, baseline y tablas Huffman estándar.
+    low_latency=False: progresivo con tablas Huffman optimizadas; archivos
+    más pequeños (menos ancho de banda) a cambio de una pasada extra de CPU.
+    """
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=75, subsampling=2,
+             optimize=not low_latency, progressive=not low_latency)
+    buf.seek(0)
+    return buf
 
 
 # ------------------------------------------------
@@ -156,81 +542,63 @@ def click_window_windows(session_info, x_rel, y_rel):
     """
     Simula un clic izquierdo en (x_rel, y_rel) relativo a la esquina superior
     izquierda de la ventana completa (incluye decoración).
-    Usa SetCursorPos y mouse_event. Devuelve (x_abs, y_abs).
+    Movimiento y pulsación van en un único SendInput, sin pausas.
+    Devuelve (x_abs, y_abs).
     """
-    with lock:
-        hwnd = session_info["hwnd"]
-        pid = session_info["pid_chrome"]
-
+    with session_info["_lock"]:
         # Verificar que el proceso siga vivo
-        try:
-            os.kill(pid, 0)
-        except OSError:
-            raise RuntimeError("El proceso de Chrome ya no existe en Windows.")
+        _check_chrome_alive(session_info)
 
-        # Reubicar HWND por si cambió
-        new_hwnd = _find_chrome_window_windows(pid)
-        if new_hwnd is None:
-            raise RuntimeError("No se encontró la ventana de Chrome al hacer clic en Windows.")
-        session_info["hwnd"] = new_hwnd
-
-        # Obtener el rect completo
-        left, top, right, bottom = _get_window_rect_windows(new_hwnd)
-        width = right - left
-        height = bottom - top
+        # HWND (revalidado) y rect completo, cacheado en _l, _t, _w, _h
+        _window_rect(session_info)
 
         # Verificar que x_rel, y_rel estén dentro del tamaño de la ventana
-        if not (0 <= x_rel < width and 0 <= y_rel < height):
+        if not (0 <= x_rel < session_info["_w"] and 0 <= y_rel < session_info["_h"]):
             raise ValueError(f"Coordenadas fuera de rango: ({x_rel}, {y_rel})")
 
         # Coordenadas absolutas
-        x_abs = left + x_rel
-        y_abs = top + y_rel
+        x_abs = session_info["_l"] + x_rel
+        y_abs = session_info["_t"] + y_rel
 
         # Mover cursor y clic
-        win32api.SetCursorPos((x_abs, y_abs))
-        win32api.mouse_event(win32con.MOUSEEVENTF_LEFTDOWN, x_abs, y_abs, 0, 0)
-        time.sleep(0.02)
-        win32api.mouse_event(win32con.MOUSEEVENTF_LEFTUP, x_abs, y_abs, 0, 0)
+        inputs = _click_inputs(x_abs, y_abs)
+        with _input_lock:
+            _send_inputs(inputs)
 
         return (x_abs, y_abs)
 
 
 # ------------------------------------------------
-#  4. Envía texto a la ventana con xdotool
+#  4. Envía texto a la ventana con SendInput
 # ------------------------------------------------
-def type_text_windows(session_info, text):
+def type_text_windows(session_info, text, delay_ms=0):
     """
-    Envía texto a la ventana de Chrome (usa SendMessage+WM_CHAR, o bien puedes usar
-    SetForegroundWindow + teclado simulado). Aquí se asume que basta con SetForegroundWindow
-    y SendMessage de caracteres, pero para simplicidad usaremos win32api.keybd_event.
+    Envía texto a la ventana de Chrome: SetForegroundWindow y luego todas las
+    pulsaciones (Unicode, ver _text_inputs) en una única llamada a SendInput,
+    sin pausas entre caracteres. Con delay_ms > 0 se envía cada pulsación
+    (abajo + arriba) por separado, esperando delay_ms milisegundos entre ellas.
     """
-    with lock:
-        hwnd = session_info["hwnd"]
-        pid = session_info["pid_chrome"]
-
+    with session_info["_lock"]:
         # Verificar proceso vivo
-        try:
-            os.kill(pid, 0)
-        except OSError:
-            raise RuntimeError("El proceso de Chrome ya no existe en Windows.")
-
-        # Reubicar HWND
-        new_hwnd = _find_chrome_window_windows(pid)
-        if new_hwnd is None:
-            raise RuntimeError("No se encontró la ventana de Chrome para enviar texto en Windows.")
-        session_info["hwnd"] = new_hwnd
-
-        # Traer la ventana al frente
-        win32gui.SetForegroundWindow(new_hwnd)
-        time.sleep(0.1)
-
-        # Enviar cada carácter como evento de teclado
-        for c in text:
-            vk = win32api.VkKeyScan(c)
-            win32api.keybd_event(vk, 0, 0, 0)           # tecla presionada
-            win32api.keybd_event(vk, 0, win32con.KEYEVENTF_KEYUP, 0)  # tecla liberada
-            time.sleep(0.02)
+        _check_chrome_alive(session_info)
+
+        # HWND (revalidado solo si dejó de ser válido)
+        hwnd = _window_rect(session_info)
+
+        inputs = _text_inputs(text)
+        with _input_lock:
+            # Traer la ventana al frente
+            win32gui.SetForegroundWindow(hwnd)
+            time.sleep(0.1)
+
+            if not delay_ms:
+                # Todas las pulsaciones en un solo SendInput
+                _send_inputs(inputs)
+            else:
+                for i in range(0, len(inputs), 2):
+                    if i:
+                        time.sleep(delay_ms / 1000)
+                    _send_inputs(inputs[i:i + 2])
 
         return True
 
@@ -242,10 +610,33 @@ def stop_session_windows(session_info):
     """
     Mata el proceso de Chrome (no hay Xvfb en Windows).
     """
-    with lock:
-        pid = session_info.get("pid_chrome")
-        if pid:
+    with session_info["_lock"]:
+        session_info.pop("_frame", None)
+        _release_print_window(session_info)
+        sct = session_info.pop("_sct", None)
+        if sct:
             try:
-                os.kill(pid, signal.SIGTERM)
+                sct.close()
             except Exception:
                 pass
+
+        proc_h = session_info.pop("_proc_h", None)
+        if proc_h is not None:
+            try:
+                win32api.TerminateProcess(proc_h, 0)
+            except Exception:
+                pass  # ya había terminado
+            # El hilo vigilante espera sobre el handle: no cerrarlo antes
+            # de que salga (si no sale a tiempo, se deja abierto)
+            watcher = session_info.pop("_watcher", None)
+            if watcher is not None:
+                watcher.join(timeout=2.0)
+            if watcher is None or not watcher.is_alive():
+                win32api.CloseHandle(proc_h)
+        else:
+            pid = session_info.get("pid_chrome")
+            if pid:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except Exception:
+                    pass